@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+"""
+Incremental batch/watch analysis over a bug-report tree.
+
+Scans ROOT for BR_YYYY-MM-DD_NN folders, finds their btsnoop logs
+(FS/data/misc/bluetooth/logs/btsnoop_hci.log*, or *.pcapng saved from
+Wireshark) and matching logcats
+(LC_YYYY-MM-DD_NN.txt anywhere under ROOT or --logcat-dir, or logcat/
+bugreport text files inside the report), and analyzes only reports whose
+files are new or changed since the last run.
+
+Per-report results are cached in SQLite:
+    sessions   sessions by >30s gaps, with first-position latency
+    commands   per-session command histogram (whole session + first 60s)
+    logcat     GdogTAK tag/level line counts and key marker counts
+    errors     per-file analysis errors (the report's other files still count)
+The fleet summary (one row per report, last session of the primary capture,
+diff vs --reference) is built from the cache, so unchanged reports are never
+re-parsed.
+
+Usage:
+    python br_watch.py ROOT [--db FILE] [--reference BR_2026-02-09_03[:3]] [--jobs N]
+    python br_watch.py ROOT --watch 30 [--settle 10]
+    python br_watch.py ROOT --format csv -o fleet.csv
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from btsnoop_compare import (
+    RENDERERS, Column, Report, Section, Table, Text,
+    detect_sessions, extract_command, open_output, parse_capture,
+)
+import garmin_decode
+
+# ============================================================
+# Constants
+# ============================================================
+
+# Bump when analysis output changes so cached reports are re-analyzed
+ANALYZER_VERSION = 3
+
+REPORT_DIR_RE = re.compile(r'^BR_(\d{4}-\d{2}-\d{2}_\d+)$')
+LOGCAT_NAME_RE = re.compile(r'^LC_(\d{4}-\d{2}-\d{2}_\d+)\.txt$', re.IGNORECASE)
+
+DEFAULT_DB_NAME = '.br_cache.sqlite'
+COMMAND_WINDOW_SECONDS = 60.0
+POSITION_CMDS = ((0x02, 0x3C), (0x02, 0x7A))
+
+# Log tags written by the Android app
+LOGCAT_TAGS = ('BleTrackingService', 'GarminProtocol', 'AtakBroadcaster', 'CotGenerator', 'MainActivity')
+LOGCAT_LINE_RE = re.compile(r'^\d\d-\d\d \d\d:\d\d:\d\d\.\d+\s+\d+\s+\d+ ([VDIWEF]) ([^:]+?)\s*:')
+LOGCAT_MARKERS = {
+    'coords_parsed': 'COORDS PARSED',
+    'parse_null': 'Parse result: null',
+    'registry_found': 'REGISTRY: Found collar',
+    'zero_positions': 'ZERO collar positions',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report        TEXT PRIMARY KEY,
+    path          TEXT NOT NULL,
+    fingerprint   TEXT NOT NULL,
+    analyzed_at   TEXT NOT NULL,
+    primary_capture TEXT,
+    captures      INTEGER NOT NULL,
+    logcats       INTEGER NOT NULL,
+    analyze_ms    REAL,
+    error         TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    report        TEXT NOT NULL,
+    capture       TEXT NOT NULL,
+    session       INTEGER NOT NULL,
+    start         TEXT NOT NULL,
+    duration      REAL NOT NULL,
+    packets       INTEGER NOT NULL,
+    writes        INTEGER NOT NULL,
+    notifications INTEGER NOT NULL,
+    first_position REAL,
+    first_fix     REAL,
+    fixes         INTEGER NOT NULL,
+    PRIMARY KEY (report, capture, session)
+);
+CREATE TABLE IF NOT EXISTS commands (
+    report        TEXT NOT NULL,
+    capture       TEXT NOT NULL,
+    session       INTEGER NOT NULL,
+    direction     TEXT NOT NULL,
+    cmd           TEXT NOT NULL,
+    count         INTEGER NOT NULL,
+    count_window  INTEGER NOT NULL,
+    first_seen    REAL NOT NULL,
+    PRIMARY KEY (report, capture, session, direction, cmd)
+);
+CREATE TABLE IF NOT EXISTS logcat (
+    report        TEXT NOT NULL,
+    tag           TEXT NOT NULL,
+    level         TEXT NOT NULL,
+    count         INTEGER NOT NULL,
+    PRIMARY KEY (report, tag, level)
+);
+CREATE TABLE IF NOT EXISTS errors (
+    report        TEXT NOT NULL,
+    file          TEXT NOT NULL,
+    error         TEXT NOT NULL,
+    PRIMARY KEY (report, file)
+);
+"""
+CACHE_TABLES = ('reports', 'sessions', 'commands', 'logcat', 'errors')
+
+
+# ============================================================
+# Scanning
+# ============================================================
+
+def file_signature(path):
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def scan_tree(root, logcat_dirs=()):
+    """
+    Find report folders and their files.
+
+    Returns {report_name: {'path', 'captures': [...], 'logcats': [...]}}.
+    """
+    reports = {}
+    loose_logcats = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        name = os.path.basename(dirpath)
+        m = REPORT_DIR_RE.match(name)
+        if m:
+            captures = []
+            logcats = []
+            for sub, _, files in os.walk(dirpath):
+                for fname in files:
+                    lower = fname.lower()
+                    full = os.path.join(sub, fname)
+                    if (lower.startswith('btsnoop') and '.log' in lower) or lower.endswith('.pcapng'):
+                        captures.append(full)
+                    elif lower.endswith('.txt') and ('logcat' in lower or lower.startswith('bugreport')
+                                                     or LOGCAT_NAME_RE.match(fname)):
+                        logcats.append(full)
+            reports[name] = {'path': dirpath, 'key': m.group(1),
+                             'captures': sorted(captures), 'logcats': sorted(logcats)}
+            dirnames[:] = []  # report contents already walked
+            continue
+        for fname in filenames:
+            lm = LOGCAT_NAME_RE.match(fname)
+            if lm:
+                loose_logcats.setdefault(lm.group(1), []).append(os.path.join(dirpath, fname))
+
+    for logcat_dir in logcat_dirs:
+        try:
+            fnames = os.listdir(logcat_dir)
+        except OSError:
+            continue    # unmounted/removed while watching; main() checked it at startup
+        for fname in fnames:
+            lm = LOGCAT_NAME_RE.match(fname)
+            if lm:
+                loose_logcats.setdefault(lm.group(1), []).append(os.path.join(logcat_dir, fname))
+
+    # LC_<date>_<nn>.txt belongs to BR_<date>_<nn>
+    for info in reports.values():
+        for path in loose_logcats.get(info['key'], ()):
+            if path not in info['logcats']:
+                info['logcats'].append(path)
+        info['logcats'].sort()
+    return reports
+
+
+def fingerprint(info):
+    """Hash of analyzer version plus every input file's path, size and mtime."""
+    h = hashlib.sha1(f"v{ANALYZER_VERSION}".encode())
+    for path in info['captures'] + info['logcats']:
+        size, mtime = file_signature(path)
+        h.update(f"{path}\0{size}\0{mtime}\n".encode('utf-8', 'surrogateescape'))
+    return h.hexdigest()
+
+
+def newest_mtime(info):
+    paths = info['captures'] + info['logcats']
+    return max((os.stat(p).st_mtime for p in paths), default=0)
+
+
+def primary_capture(captures):
+    """Prefer the live btsnoop_hci.log over .last/rotated files, else the largest."""
+    for path in captures:
+        if os.path.basename(path).lower() == 'btsnoop_hci.log':
+            return path
+    return max(captures, key=_size_or_zero) if captures else None
+
+
+def _size_or_zero(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+# ============================================================
+# Analysis (runs in worker processes)
+# ============================================================
+
+def analyze_capture(path):
+    """Sessions and per-session command histograms for one btsnoop log."""
+    packets = parse_capture(path)
+    sessions = []
+    commands = []
+    for idx, (s, e) in enumerate(detect_sessions(packets)):
+        pkts = packets[s:e+1]
+        t0 = pkts[0]['ts_us']
+        first_position = None
+        first_fix = None
+        fixes = 0
+        hist = {}
+        for pkt in pkts:
+            offset = (pkt['ts_us'] - t0) / 1_000_000.0
+            label, is_cont, cmd, frag_info = extract_command(pkt['data'])
+            if cmd is not None and not is_cont:
+                key = (pkt['type'], f"{cmd[0]:02X}_{cmd[1]:02X}")
+                entry = hist.get(key)
+                if entry is None:
+                    hist[key] = entry = [0, 0, offset]
+                entry[0] += 1
+                if offset <= COMMAND_WINDOW_SECONDS:
+                    entry[1] += 1
+            if pkt['type'] != 'notification':
+                continue
+            if first_position is None and cmd in POSITION_CMDS:
+                first_position = offset
+            if garmin_decode.parse_notification(pkt['data']) is not None:
+                fixes += 1
+                if first_fix is None:
+                    first_fix = offset
+        sessions.append({
+            'session': idx,
+            'start': pkts[0]['timestamp'].isoformat(),
+            'duration': (pkts[-1]['ts_us'] - t0) / 1_000_000.0,
+            'packets': len(pkts),
+            'writes': sum(1 for p in pkts if p['type'] == 'write'),
+            'notifications': sum(1 for p in pkts if p['type'] == 'notification'),
+            'first_position': first_position,
+            'first_fix': first_fix,
+            'fixes': fixes,
+        })
+        for (direction, key), (count, count_window, first_seen) in hist.items():
+            commands.append((idx, direction, key, count, count_window, first_seen))
+    return sessions, commands
+
+
+def read_logcat(path):
+    """Logcat text; PowerShell redirects produce UTF-16 with a BOM."""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return raw.decode('utf-16', errors='replace')
+    return raw.decode('utf-8', errors='replace')
+
+
+def analyze_logcat(path, counts):
+    for line in read_logcat(path).splitlines():
+        m = LOGCAT_LINE_RE.match(line)
+        if not m or m.group(2) not in LOGCAT_TAGS:
+            continue
+        key = (m.group(2), m.group(1))
+        counts[key] = counts.get(key, 0) + 1
+        for marker, text in LOGCAT_MARKERS.items():
+            if text in line:
+                mkey = ('marker', marker)
+                counts[mkey] = counts.get(mkey, 0) + 1
+
+
+def analyze_report(name, info):
+    """
+    Analyze one report folder. Returns a picklable result dict.
+
+    A file that fails is recorded in 'errors' and the rest are still analyzed.
+    'retry' is set when a failure was an OSError (file rotated, removed or
+    still being copied), so the result is not cached as final.
+    """
+    started = time.perf_counter()
+    result = {'report': name, 'info': info, 'captures': {}, 'logcat': {}, 'errors': {}, 'retry': False}
+    for path in info['captures'] + info['logcats']:
+        try:
+            if path in info['captures']:
+                result['captures'][path] = analyze_capture(path)
+            else:
+                counts = {}
+                analyze_logcat(path, counts)
+                for key, count in counts.items():
+                    result['logcat'][key] = result['logcat'].get(key, 0) + count
+        except Exception as e:  # record and keep going with the rest of the report
+            result['errors'][path] = f"{type(e).__name__}: {e}"
+            result['retry'] |= isinstance(e, OSError)
+    result['analyze_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+# ============================================================
+# Cache
+# ============================================================
+
+def open_db(path):
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+
+def store_result(db, result, fp):
+    name = result['report']
+    info = result['info']
+    root = info['path']
+    errors = [(os.path.relpath(path, root), error) for path, error in sorted(result['errors'].items())]
+    summary = None
+    if errors:
+        summary = f"{errors[0][0]}: {errors[0][1]}" + (f" (+{len(errors) - 1} more)" if len(errors) > 1 else "")
+    with db:
+        for table in CACHE_TABLES:
+            db.execute(f"DELETE FROM {table} WHERE report = ?", (name,))
+        primary = primary_capture(info['captures'])
+        db.execute(
+            "INSERT INTO reports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, root, fp, datetime.datetime.now().isoformat(timespec='seconds'),
+             os.path.relpath(primary, root) if primary else None,
+             len(info['captures']), len(info['logcats']), result['analyze_ms'], summary))
+        for path, (sessions, commands) in result['captures'].items():
+            capture = os.path.relpath(path, root)
+            db.executemany(
+                "INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(name, capture, s['session'], s['start'], s['duration'], s['packets'],
+                  s['writes'], s['notifications'], s['first_position'], s['first_fix'], s['fixes'])
+                 for s in sessions])
+            db.executemany(
+                "INSERT INTO commands VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(name, capture) + row for row in commands])
+        db.executemany(
+            "INSERT INTO logcat VALUES (?, ?, ?, ?)",
+            [(name, tag, level, count) for (tag, level), count in result['logcat'].items()])
+        db.executemany("INSERT INTO errors VALUES (?, ?, ?)", [(name,) + e for e in errors])
+
+
+def update_cache(db, reports, jobs=1, settle=0.0, log=sys.stderr):
+    """Analyze new/changed reports. Returns names of reports that were (re)analyzed."""
+    cached = dict(db.execute("SELECT report, fingerprint FROM reports"))
+    now = time.time()
+    pending = {}
+    for name, info in sorted(reports.items()):
+        try:
+            fp = fingerprint(info)
+            if cached.get(name) != fp and settle and now - newest_mtime(info) < settle:
+                log.write(f"  {name}: files still changing, deferring\n")
+                continue
+        except OSError as e:
+            # Rotated or removed between the scan and stat; pick it up next pass
+            log.write(f"  {name}: {e.strerror}: {e.filename}, deferring\n")
+            continue
+        if cached.get(name) == fp:
+            continue
+        pending[name] = (info, fp)
+
+    # Reports whose folders disappeared drop out of the cache
+    for name in set(cached) - set(reports):
+        with db:
+            for table in CACHE_TABLES:
+                db.execute(f"DELETE FROM {table} WHERE report = ?", (name,))
+
+    if not pending:
+        return []
+
+    def finish(result):
+        info, fp = pending[result['report']]
+        # An empty fingerprint never matches, so I/O failures are retried next pass
+        store_result(db, result, '' if result['retry'] else fp)
+        errors = result['errors']
+        status = f"{len(errors)} file(s) failed" if errors else "ok"
+        log.write(f"  analyzed {result['report']} ({result['analyze_ms']:.0f} ms): {status}\n")
+        for path, error in sorted(errors.items()):
+            log.write(f"    ERROR {path}: {error}\n")
+
+    if jobs > 1 and len(pending) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(analyze_report, name, info) for name, (info, _) in pending.items()]
+            for future in concurrent.futures.as_completed(futures):
+                finish(future.result())
+    else:
+        for name, (info, _) in pending.items():
+            finish(analyze_report(name, info))
+    return sorted(pending)
+
+
+# ============================================================
+# Fleet summary
+# ============================================================
+
+def summary_session(db, report, session=None):
+    """(capture, session) used for a report: given session, else the last one."""
+    row = db.execute("SELECT primary_capture FROM reports WHERE report = ?", (report,)).fetchone()
+    if row is None or row[0] is None:
+        return None
+    capture = row[0]
+    if session is None:
+        last = db.execute("SELECT MAX(session) FROM sessions WHERE report = ? AND capture = ?",
+                          (report, capture)).fetchone()[0]
+        if last is None:
+            return None
+        session = last
+    return capture, session
+
+
+def window_commands(db, report, capture, session):
+    rows = db.execute(
+        "SELECT cmd, count_window FROM commands WHERE report = ? AND capture = ? AND session = ? "
+        "AND direction = 'notification' AND count_window > 0", (report, capture, session))
+    return dict(rows)
+
+
+def build_summary(db, reference=None):
+    report = Report("BUG REPORT FLEET SUMMARY")
+    sec = Section(f"FLEET SUMMARY (last session of primary capture"
+                  f"{', diff vs ' + reference if reference else ''})")
+    report.sections.append(sec)
+
+    ref_cmds = None
+    if reference:
+        ref_name, _, ref_session = reference.partition(':')
+        ref = summary_session(db, ref_name, int(ref_session) if ref_session else None)
+        if ref is None:
+            sec.add(Text(f"\n  WARNING: reference {reference} not in cache"))
+        else:
+            ref_cmds = window_commands(db, ref_name, *ref)
+
+    columns = [
+        Column('report', 'Report', 16, '<16', align='<'),
+        Column('sessions', 'Sess', 4, '4d'),
+        Column('session', 'Used', 4, '4d', missing='-'),
+        Column('duration', 'Duration', 9, '.1f', suffix='s', align='>', missing='-'),
+        Column('writes', 'Writes', 6, '6d', missing='-'),
+        Column('notifications', 'Notifs', 6, '6d', missing='-'),
+        Column('first_position', '1st Pos', 8, '.2f', suffix='s', align='>', missing='none'),
+        Column('first_fix', '1st Fix', 8, '.2f', suffix='s', align='>', missing='none'),
+        Column('fixes', 'Fixes', 6, '6d', missing='-'),
+        Column('log_errors', 'LogE', 5, '5d'),
+        Column('log_warnings', 'LogW', 5, '5d'),
+        Column('missing', 'Missing', 7, '7d', missing='-'),
+        Column('extra', 'Extra', 5, '5d', missing='-'),
+        Column('notes', 'Notes', sep='   ', rule=30),
+    ]
+    rows = []
+    for name, primary, error in db.execute(
+            "SELECT report, primary_capture, error FROM reports ORDER BY report").fetchall():
+        n_sessions = db.execute("SELECT COUNT(*) FROM sessions WHERE report = ? AND capture = ?",
+                                (name, primary)).fetchone()[0]
+        log = dict(db.execute(
+            "SELECT level, SUM(count) FROM logcat WHERE report = ? AND tag != 'marker' GROUP BY level",
+            (name,)))
+        picked = summary_session(db, name)
+        notes = error or ''
+        if picked is None:
+            rows.append((name, n_sessions, None, None, None, None, None, None, None,
+                         log.get('E', 0), log.get('W', 0), None, None, notes or 'no capture'))
+            continue
+        capture, session = picked
+        s = db.execute(
+            "SELECT duration, writes, notifications, first_position, first_fix, fixes FROM sessions "
+            "WHERE report = ? AND capture = ? AND session = ?", (name, capture, session)).fetchone()
+        missing = extra = None
+        if ref_cmds is not None:
+            cmds = window_commands(db, name, capture, session)
+            only_ref = sorted(set(ref_cmds) - set(cmds))
+            extra = len(set(cmds) - set(ref_cmds))
+            missing = len(only_ref)
+            if only_ref and not notes:
+                notes = "missing " + ','.join(only_ref[:6]) + ('...' if len(only_ref) > 6 else '')
+        rows.append((name, n_sessions, session) + tuple(s) +
+                    (log.get('E', 0), log.get('W', 0), missing, extra, notes))
+    sec.add(Text())
+    sec.add(Table('fleet', columns, rows))
+    return report
+
+
+def run_once(args, db):
+    reports = scan_tree(args.root, args.logcat_dir)
+    changed = update_cache(db, reports, args.jobs, args.settle if args.watch else 0.0)
+    return reports, changed
+
+
+def write_summary(db, args):
+    report = build_summary(db, args.reference)
+    out = open_output(args.output, args.format)
+    try:
+        RENDERERS[args.format](report, out)
+    finally:
+        out.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental analysis of a BR_* bug-report tree.")
+    parser.add_argument('root', help="directory containing BR_YYYY-MM-DD_NN folders")
+    parser.add_argument('--db', help=f"SQLite cache (default ROOT/{DEFAULT_DB_NAME})")
+    parser.add_argument('--logcat-dir', action='append', default=[],
+                        help="extra directory holding LC_YYYY-MM-DD_NN.txt logcats (repeatable)")
+    parser.add_argument('--reference', metavar='REPORT[:SESSION]',
+                        help="report to diff first-60s notification commands against")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes for analysis (default: CPU count)")
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help="rescan every SECONDS and reprint the summary when something changed")
+    parser.add_argument('--settle', type=float, default=10.0,
+                        help="in watch mode, wait until files are this many seconds old")
+    parser.add_argument('--format', choices=sorted(RENDERERS), default='text')
+    parser.add_argument('-o', '--output', metavar='FILE', help="write the summary to FILE")
+    args = parser.parse_args(argv)
+    for logcat_dir in args.logcat_dir:
+        if not os.path.isdir(logcat_dir):
+            parser.error(f"--logcat-dir {logcat_dir}: not a directory")
+
+    db = open_db(args.db or os.path.join(args.root, DEFAULT_DB_NAME))
+    try:
+        reports, changed = run_once(args, db)
+        sys.stderr.write(f"  {len(reports)} reports, {len(changed)} analyzed, "
+                         f"{len(reports) - len(changed)} from cache\n")
+        write_summary(db, args)
+        while args.watch:
+            time.sleep(args.watch)
+            reports, changed = run_once(args, db)
+            if changed:
+                write_summary(db, args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,20 +3,62 @@
 Compare WORKING Garmin Explore session (BR_2026-02-09_03, Session 3)
 with FAILING GdogTAK session (BR_2026-02-09_05, last session).
 
-Parses btsnoop_hci.log files, extracts ATT writes and notifications,
-detects sessions by >30s gaps, and provides side-by-side comparison.
+Parses btsnoop_hci.log files (or Wireshark pcapng saves of them), extracts
+ATT writes and notifications, detects sessions by >30s gaps, and provides
+side-by-side comparison. Use capture_export.py to hand a session back to
+Wireshark.
+
+Usage:
+    python btsnoop_compare.py [--working FILE] [--failing FILE]
+    python btsnoop_compare.py --format json -o report.json
+    python btsnoop_compare.py --profile [--profile-pstats OUT.prof] [--profile-trace OUT.json]
+
+The report is built as a structured model (sections of tables and facts) and
+rendered once as text, JSON or CSV through a single buffered writer. Packet hex
+is only formatted for rows that are actually rendered.
+
+With --profile, each pipeline stage (file parsing, session detection, render)
+and each report section, both when built and when rendered, is timed (wall +
+CPU), its record count and peak traced memory are recorded, and calls to the
+hot helpers (extract_command, format_hex, render_cell) are counted and timed
+per stage. The summary table goes to stderr so the report output is unchanged.
+--profile-pstats leaves the helpers uncounted so cProfile sees them directly.
 """
 
+import argparse
+import contextlib
+import cProfile
+import csv
+import json
+import pstats
 import struct
 import datetime
 import os
 import sys
+import time
+import tracemalloc
 
 # ============================================================
 # Constants
 # ============================================================
 
+UNIX_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# btsnoop timestamps count microseconds from 0000-01-01; this is 1970-01-01
+# on that scale
+BTSNOOP_UNIX_OFFSET_US = 0x00DCDDB30F2F8000
+
+# Logs with relative timestamps (below the offset) are shown from 2000-01-01
 BTSNOOP_EPOCH = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+BTSNOOP_EPOCH_UNIX_US = (BTSNOOP_EPOCH - UNIX_EPOCH) // datetime.timedelta(microseconds=1)
+
+# pcapng blocks and the Bluetooth link types Wireshark saves HCI captures as
+PCAPNG_SHB_MAGIC = b'\x0A\x0D\x0D\x0A'
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_EPB = 0x00000006
+LINKTYPE_BLUETOOTH_HCI_H4 = 187
+LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR = 201
 
 WORKING_FILE = r"C:\PROJECTS\GDOGTAK-WORKSPACE\LOGS\BUG-REPORTS\BR_2026-02-09_03\FS\data\misc\bluetooth\logs\btsnoop_hci.log"
 FAILING_FILE = r"C:\PROJECTS\GDOGTAK-WORKSPACE\LOGS\BUG-REPORTS\BR_2026-02-09_05\FS\data\misc\bluetooth\logs\btsnoop_hci.log"
@@ -101,15 +143,66 @@ CMD_LABELS = {
 # Parsing
 # ============================================================
 
-def parse_btsnoop(filepath):
-    """Parse a btsnoop_hci.log file and return list of ATT packets."""
+def btsnoop_unix_us(ts_us):
+    """Microseconds since 1970 for a btsnoop timestamp (relative ones count from BTSNOOP_EPOCH)."""
+    if ts_us >= BTSNOOP_UNIX_OFFSET_US:
+        return ts_us - BTSNOOP_UNIX_OFFSET_US
+    return BTSNOOP_EPOCH_UNIX_US + ts_us
+
+
+def att_packet(data, ts_us, is_received):
+    """
+    Decode one H4 HCI packet (type byte first) into an ATT packet dict, or
+    None if it is not an ATT write or notification.
+    """
+    # Check for ACL packet (HCI type 0x02)
+    if len(data) < 12 or data[0] != 0x02:
+        return None
+
+    # L2CAP CID at bytes 7:9 (little-endian)
+    l2cap_cid = struct.unpack('<H', data[7:9])[0]
+    if l2cap_cid != 0x0004:  # ATT channel
+        return None
+
+    att_opcode = data[9]
+    if att_opcode in (0x12, 0x52):  # Write Request / Write Command
+        pkt_type = 'write'
+    elif att_opcode == 0x1B:  # Handle Value Notification
+        pkt_type = 'notification'
+    else:
+        return None
+
+    handle = struct.unpack('<H', data[10:12])[0]
+    att_data = data[12:]
+    return {
+        'type': pkt_type,
+        'timestamp': UNIX_EPOCH + datetime.timedelta(microseconds=btsnoop_unix_us(ts_us)),
+        'ts_us': ts_us,
+        'handle': handle,
+        'opcode': att_opcode,
+        'data': att_data,
+        'is_received': is_received,
+        'raw_size': len(att_data),
+        'acl_handle': struct.unpack('<H', data[1:3])[0] & 0x0FFF,
+    }
+
+
+def parse_btsnoop(filepath, stats=None):
+    """
+    Parse a btsnoop_hci.log file and return list of ATT packets.
+
+    If a stats dict is given, it is filled with the number of HCI records
+    and bytes read (used by --profile).
+    """
     packets = []
+    n_records = 0
+    n_bytes = 16
 
     with open(filepath, 'rb') as f:
         # Read 16-byte file header
         header = f.read(16)
         if len(header) < 16:
-            print(f"ERROR: File too short for header: {filepath}")
+            print(f"ERROR: File too short for header: {filepath}", file=sys.stderr)
             return packets
 
         # Parse records
@@ -125,59 +218,109 @@ def parse_btsnoop(filepath):
             data = f.read(incl_len)
             if len(data) < incl_len:
                 break
+            n_records += 1
+            n_bytes += 24 + incl_len
 
-            # Convert timestamp
-            ts_dt = BTSNOOP_EPOCH + datetime.timedelta(microseconds=ts_us)
+            pkt = att_packet(data, ts_us, (flags & 0x01) == 1)
+            if pkt is not None:
+                packets.append(pkt)
 
-            is_received = (flags & 0x01) == 1
+    if stats is not None:
+        stats['records'] = n_records
+        stats['bytes'] = n_bytes
+    return packets
 
-            # Check for ACL packet (HCI type 0x02)
-            if len(data) < 10:
-                continue
-            if data[0] != 0x02:
-                continue
 
-            # L2CAP CID at bytes 7:9 (little-endian)
-            l2cap_cid = struct.unpack('<H', data[7:9])[0]
-            if l2cap_cid != 0x0004:  # ATT channel
-                continue
+def parse_pcapng(filepath, stats=None):
+    """
+    Parse a pcapng file (as saved by Wireshark) and return list of ATT packets.
 
-            att_opcode = data[9]
+    Only interfaces with LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR (4-byte
+    direction pseudo-header, bit 0 set = received) or plain
+    LINKTYPE_BLUETOOTH_HCI_H4 are decoded. Timestamps are converted to the
+    btsnoop scale so sessions and ts_us compare the same as for btsnoop logs.
+    """
+    packets = []
+    n_records = 0
+    n_bytes = 0
+    endian = '<'
+    interfaces = []     # (linktype, timestamp units per second)
 
-            if att_opcode in (0x12, 0x52):  # Write Request / Write Command
-                if len(data) < 12:
+    with open(filepath, 'rb') as f:
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                break
+            if head[:4] == PCAPNG_SHB_MAGIC:
+                # Byte order comes from the magic at the start of the body
+                bom = f.read(4)
+                endian = '<' if bom == b'\x4D\x3C\x2B\x1A' else '>'
+                block_len = struct.unpack(endian + 'I', head[4:8])[0]
+                body = bom + f.read(block_len - 12)
+                interfaces = []
+            else:
+                block_type, block_len = struct.unpack(endian + 'II', head)
+                body = f.read(block_len - 8)
+            if block_len < 12 or len(body) < block_len - 8:
+                break
+            n_bytes += block_len
+            block_type = struct.unpack(endian + 'I', head[:4])[0]
+            body = body[:-4]    # trailing block length
+
+            if block_type == PCAPNG_IDB:
+                linktype = struct.unpack(endian + 'H', body[:2])[0]
+                interfaces.append((linktype, _pcapng_tsresol(body[8:], endian)))
+            elif block_type == PCAPNG_EPB:
+                if_id, ts_hi, ts_lo, cap_len = struct.unpack(endian + 'IIII', body[:16])
+                n_records += 1
+                if if_id >= len(interfaces):
                     continue
-                handle = struct.unpack('<H', data[10:12])[0]
-                att_data = data[12:]
-                packets.append({
-                    'type': 'write',
-                    'timestamp': ts_dt,
-                    'ts_us': ts_us,
-                    'handle': handle,
-                    'opcode': att_opcode,
-                    'data': att_data,
-                    'is_received': is_received,
-                    'raw_size': len(att_data),
-                })
-            elif att_opcode == 0x1B:  # Handle Value Notification
-                if len(data) < 12:
+                linktype, units = interfaces[if_id]
+                data = body[20:20 + cap_len]
+                if linktype == LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR:
+                    if len(data) < 4:
+                        continue
+                    is_received = (struct.unpack('>I', data[:4])[0] & 0x01) == 1
+                    data = data[4:]
+                elif linktype == LINKTYPE_BLUETOOTH_HCI_H4:
+                    is_received = False
+                else:
                     continue
-                handle = struct.unpack('<H', data[10:12])[0]
-                att_data = data[12:]
-                packets.append({
-                    'type': 'notification',
-                    'timestamp': ts_dt,
-                    'ts_us': ts_us,
-                    'handle': handle,
-                    'opcode': att_opcode,
-                    'data': att_data,
-                    'is_received': is_received,
-                    'raw_size': len(att_data),
-                })
-
+                ts = (ts_hi << 32) | ts_lo
+                ts_us = BTSNOOP_UNIX_OFFSET_US + ts * 1_000_000 // units
+                pkt = att_packet(data, ts_us, is_received)
+                if pkt is not None:
+                    packets.append(pkt)
+
+    if stats is not None:
+        stats['records'] = n_records
+        stats['bytes'] = n_bytes
     return packets
 
 
+def _pcapng_tsresol(options, endian):
+    """Timestamp units per second from the if_tsresol IDB option (default us)."""
+    i = 0
+    while i + 4 <= len(options):
+        code, length = struct.unpack(endian + 'HH', options[i:i + 4])
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            resol = options[i + 4]
+            return 2 ** (resol & 0x7F) if resol & 0x80 else 10 ** resol
+        i += 4 + (length + 3) // 4 * 4
+    return 1_000_000
+
+
+def parse_capture(filepath, stats=None):
+    """Parse a btsnoop log or a pcapng file, detected from its first bytes."""
+    with open(filepath, 'rb') as f:
+        magic = f.read(4)
+    if magic == PCAPNG_SHB_MAGIC:
+        return parse_pcapng(filepath, stats)
+    return parse_btsnoop(filepath, stats)
+
+
 def detect_sessions(packets):
     """Detect sessions by >30 sec gaps. Returns list of (start_idx, end_idx) tuples."""
     if not packets:
@@ -247,346 +390,692 @@ def extract_command(data):
 
 def format_hex(data, max_bytes=60):
     """Format bytes as hex string, truncating if needed."""
-    hex_str = data[:max_bytes].hex()
-    # Add spaces every 2 chars for readability
-    spaced = ' '.join(hex_str[i:i+2] for i in range(0, len(hex_str), 2))
+    spaced = data[:max_bytes].hex(' ')
     if len(data) > max_bytes:
         spaced += f" ... (+{len(data)-max_bytes} bytes)"
     return spaced
 
 
-def print_separator(char='=', width=130):
-    print(char * width)
+# ============================================================
+# Report model
+# ============================================================
+#
+# Sections build a Report out of plain values; nothing is formatted until a
+# renderer walks it. Blocks are:
+#   Text  - presentational line, text output only
+#   Fact  - one structured record with a text template (grouped by table name)
+#   Table - column specs + row tuples
+# Packet payloads are stored as HexCell so format_hex only runs for rows that
+# are actually rendered.
 
+REPORT_WIDTH = 130
+OUTPUT_BUFFER = 1 << 16
 
-def print_header(text, char='=', width=130):
-    print()
-    print(char * width)
-    print(f"  {text}")
-    print(char * width)
 
+class HexCell:
+    """Packet bytes, formatted as spaced hex only when rendered as text."""
+    __slots__ = ('data', 'max_bytes')
 
-# ============================================================
-# Main comparison
-# ============================================================
+    def __init__(self, data, max_bytes=60):
+        self.data = data
+        self.max_bytes = max_bytes
 
-def main():
-    print_header("BTSNOOP COMPARISON: WORKING (Garmin Explore) vs FAILING (GdogTAK)")
-    print(f"  WORKING file: {WORKING_FILE}")
-    print(f"  FAILING file: {FAILING_FILE}")
-    print(f"  Working file size: {os.path.getsize(WORKING_FILE):,} bytes")
-    print(f"  Failing file size: {os.path.getsize(FAILING_FILE):,} bytes")
-
-    # ---- Parse both files ----
-    print("\n  Parsing WORKING file...")
-    working_pkts = parse_btsnoop(WORKING_FILE)
-    print(f"  Found {len(working_pkts)} ATT packets (writes + notifications)")
-
-    print("  Parsing FAILING file...")
-    failing_pkts = parse_btsnoop(FAILING_FILE)
-    print(f"  Found {len(failing_pkts)} ATT packets (writes + notifications)")
-
-    # ---- Detect sessions ----
-    working_sessions = detect_sessions(working_pkts)
-    failing_sessions = detect_sessions(failing_pkts)
-
-    print_header("SESSION DETECTION")
-
-    print(f"\n  WORKING file: {len(working_sessions)} sessions detected")
-    for i, (s, e) in enumerate(working_sessions):
-        t_start = working_pkts[s]['timestamp']
-        t_end = working_pkts[e]['timestamp']
-        duration = (working_pkts[e]['ts_us'] - working_pkts[s]['ts_us']) / 1_000_000.0
-        n_writes = sum(1 for p in working_pkts[s:e+1] if p['type'] == 'write')
-        n_notifs = sum(1 for p in working_pkts[s:e+1] if p['type'] == 'notification')
-        print(f"    Session {i}: {t_start.strftime('%H:%M:%S')} - {t_end.strftime('%H:%M:%S')} "
-              f"({duration:.1f}s) | {e-s+1} pkts ({n_writes} writes, {n_notifs} notifs)")
-
-    print(f"\n  FAILING file: {len(failing_sessions)} sessions detected")
-    for i, (s, e) in enumerate(failing_sessions):
-        t_start = failing_pkts[s]['timestamp']
-        t_end = failing_pkts[e]['timestamp']
-        duration = (failing_pkts[e]['ts_us'] - failing_pkts[s]['ts_us']) / 1_000_000.0
-        n_writes = sum(1 for p in failing_pkts[s:e+1] if p['type'] == 'write')
-        n_notifs = sum(1 for p in failing_pkts[s:e+1] if p['type'] == 'notification')
-        print(f"    Session {i}: {t_start.strftime('%H:%M:%S')} - {t_end.strftime('%H:%M:%S')} "
-              f"({duration:.1f}s) | {e-s+1} pkts ({n_writes} writes, {n_notifs} notifs)")
+    def __format__(self, spec):
+        return format(format_hex(self.data, self.max_bytes), spec)
 
-    # ---- Select target sessions ----
-    # WORKING: Session 3 (0-indexed) - the reconnect session at ~11:45
-    if len(working_sessions) < 4:
-        print(f"\n  WARNING: Expected 4 sessions in WORKING file, found {len(working_sessions)}")
-        print("  Using last session as fallback")
-        w_idx = len(working_sessions) - 1
+    def to_json(self):
+        return self.data.hex()
+
+
+class Column:
+    """
+    A table column.
+
+    Text cells are prefix + format(value, spec) + suffix, then aligned to
+    width if align is set. Header is right-aligned to width (or left as-is
+    when width is None); the rule under it is rule or width dashes.
+    """
+
+    def __init__(self, key, header, width=None, spec='', prefix='', suffix='',
+                 align=None, sep=' ', rule=None, missing=''):
+        self.key = key
+        self.header = header
+        self.width = width
+        self.spec = spec
+        self.prefix = prefix
+        self.suffix = suffix
+        self.align = align
+        self.sep = sep
+        self.rule = rule if rule is not None else width
+        self.missing = missing
+
+
+class Text:
+    def __init__(self, text=''):
+        self.text = text
+
+
+class Fact:
+    def __init__(self, table, template, **fields):
+        self.table = table
+        self.template = template
+        self.fields = fields
+
+
+class Table:
+    def __init__(self, name, columns, rows=None, indent=2, **meta):
+        self.name = name
+        self.columns = columns
+        self.rows = rows if rows is not None else []
+        self.indent = indent
+        self.meta = meta    # e.g. capture='WORKING', emitted as leading JSON/CSV fields
+
+
+class Section:
+    def __init__(self, title, blocks=None):
+        self.title = title
+        self.blocks = blocks if blocks is not None else []
+
+    def add(self, block):
+        self.blocks.append(block)
+        return block
+
+    def record_count(self):
+        n = 0
+        for block in self.blocks:
+            if isinstance(block, Table):
+                n += len(block.rows)
+            elif isinstance(block, Fact):
+                n += 1
+        return n
+
+
+class Report:
+    def __init__(self, title, sections=None):
+        self.title = title
+        self.sections = sections if sections is not None else []
+
+
+def render_cell(col, value):
+    """Format one table cell for text output."""
+    if value is None:
+        text = col.missing
     else:
-        w_idx = 3  # Session 3 (0-indexed)
+        text = f"{col.prefix}{format(value, col.spec)}{col.suffix}"
+    if col.width and (col.align or value is None):
+        text = format(text, f"{col.align or '>'}{col.width}")
+    return text
+
+
+def _json_value(value):
+    if isinstance(value, HexCell):
+        return value.to_json()
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, (tuple, set, frozenset)):
+        return list(value)
+    return value
+
+
+def render_text(report, out, prof=None):
+    if prof is None:
+        prof = _NullProfiler()
+    rule = '=' * REPORT_WIDTH
+    rows = 0
+    for section in report.sections:
+        with prof.stage(section.title, 'section') as st:
+            out.write(f"\n{rule}\n  {section.title}\n{rule}\n")
+            for block in section.blocks:
+                if isinstance(block, Text):
+                    out.write(block.text + '\n')
+                elif isinstance(block, Fact):
+                    out.write(block.template.format(**block.fields) + '\n')
+                    rows += 1
+                elif isinstance(block, Table):
+                    pad = ' ' * block.indent
+                    cols = block.columns
+                    header = pad + ''.join(
+                        (c.sep if i else '') + (f"{c.header:>{c.width}}" if c.width else c.header)
+                        for i, c in enumerate(cols))
+                    dashes = pad + ''.join(
+                        (c.sep if i else '') + '-' * c.rule for i, c in enumerate(cols))
+                    out.write(header + '\n' + dashes + '\n')
+                    for row in block.rows:
+                        out.write(pad + ''.join(
+                            (c.sep if i else '') + render_cell(c, v)
+                            for i, (c, v) in enumerate(zip(cols, row))) + '\n')
+                    rows += len(block.rows)
+            st.records = section.record_count()
+    return rows
+
+
+def render_json(report, out, prof=None):
+    if prof is None:
+        prof = _NullProfiler()
+    doc = {'report': report.title, 'sections': []}
+    rows = 0
+    for section in report.sections:
+        with prof.stage(section.title, 'section') as st:
+            blocks = []
+            for block in section.blocks:
+                if isinstance(block, Fact):
+                    item = {'type': 'fact', 'table': block.table}
+                    item.update((k, _json_value(v)) for k, v in block.fields.items())
+                    blocks.append(item)
+                    rows += 1
+                elif isinstance(block, Table):
+                    keys = [c.key for c in block.columns]
+                    item = {'type': 'table', 'table': block.name}
+                    item.update(block.meta)
+                    item['rows'] = [{k: _json_value(v) for k, v in zip(keys, row)}
+                                    for row in block.rows]
+                    blocks.append(item)
+                    rows += len(block.rows)
+            doc['sections'].append({'title': section.title, 'blocks': blocks})
+            st.records = section.record_count()
+    with prof.stage("json.dump", 'section'):
+        json.dump(doc, out, indent=1)
+        out.write('\n')
+    return rows
+
+
+def render_csv(report, out, prof=None):
+    """
+    Write every table as its own CSV block (header row, data rows, blank line).
+    Facts sharing a table name within a section are collected into one block.
+    Leading columns are section, table and any table metadata.
+    """
+    if prof is None:
+        prof = _NullProfiler()
+    writer = csv.writer(out)
+    rows = 0
+
+    def emit(section_title, name, meta, keys, records):
+        writer.writerow(['section', 'table'] + list(meta) + keys)
+        prefix = [section_title, name] + list(meta.values())
+        writer.writerows(prefix + [_json_value(v) for v in rec] for rec in records)
+        writer.writerow([])
+
+    for section in report.sections:
+        with prof.stage(section.title, 'section') as st:
+            facts = {}
+            for block in section.blocks:
+                if isinstance(block, Fact):
+                    group = facts.setdefault(block.table, [])
+                    group.append(block.fields)
+                elif isinstance(block, Table):
+                    emit(section.title, block.name, block.meta,
+                         [c.key for c in block.columns], block.rows)
+                    rows += len(block.rows)
+            for name, records in facts.items():
+                keys = list(dict.fromkeys(k for rec in records for k in rec))
+                emit(section.title, name, {}, keys,
+                     [[rec.get(k) for k in keys] for rec in records])
+                rows += len(records)
+            st.records = section.record_count()
+    return rows
+
+
+RENDERERS = {
+    'text': render_text,
+    'json': render_json,
+    'csv': render_csv,
+}
 
-    # FAILING: Last session
-    f_idx = len(failing_sessions) - 1
 
-    w_start, w_end = working_sessions[w_idx]
-    f_start, f_end = failing_sessions[f_idx]
+def open_output(path=None, fmt='text'):
+    """One buffered text writer for the whole report (stdout when path is None)."""
+    newline = '' if fmt == 'csv' else None
+    if path:
+        return open(path, 'w', encoding='utf-8', newline=newline, buffering=OUTPUT_BUFFER)
+    sys.stdout.flush()
+    return open(sys.stdout.fileno(), 'w', encoding=sys.stdout.encoding or 'utf-8',
+                newline=newline, buffering=OUTPUT_BUFFER, closefd=False)
+
+
+# ============================================================
+# Profiling (--profile)
+# ============================================================
+
+# Helpers whose call counts and cumulative time are tracked per stage
+PROFILED_FUNCTIONS = ('extract_command', 'format_hex', 'render_cell')
 
-    w_session = working_pkts[w_start:w_end+1]
-    f_session = failing_pkts[f_start:f_end+1]
 
-    w_t0 = w_session[0]['ts_us']
-    f_t0 = f_session[0]['ts_us']
+class StageStats:
+    """Measurements for one pipeline stage or report section."""
 
-    print_header("SELECTED SESSIONS FOR COMPARISON")
-    print(f"  WORKING: Session {w_idx} | Start: {w_session[0]['timestamp'].strftime('%H:%M:%S.%f')} | {len(w_session)} packets")
-    print(f"  FAILING: Session {f_idx} | Start: {f_session[0]['timestamp'].strftime('%H:%M:%S.%f')} | {len(f_session)} packets")
+    def __init__(self, name, kind, start_offset):
+        self.name = name
+        self.kind = kind            # 'stage' or 'section'
+        self.start_offset = start_offset  # seconds since profiler start
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.records = None
+        self.peak_bytes = None
+        self.calls = {}             # function name -> [count, seconds]
 
-    # ---- Extract writes and notifications ----
-    w_writes = [p for p in w_session if p['type'] == 'write']
-    w_notifs = [p for p in w_session if p['type'] == 'notification']
-    f_writes = [p for p in f_session if p['type'] == 'write']
-    f_notifs = [p for p in f_session if p['type'] == 'notification']
 
-    print(f"  WORKING: {len(w_writes)} writes, {len(w_notifs)} notifications")
-    print(f"  FAILING: {len(f_writes)} writes, {len(f_notifs)} notifications")
+class StageProfiler:
+    """
+    Records wall time, CPU time, record counts and peak memory per stage.
 
-    # ============================================================
-    # 5. FIRST 20 WRITES side-by-side
-    # ============================================================
-    print_header("FIRST 20 WRITES - SIDE BY SIDE COMPARISON")
+    Stages are flat and sequential: begin() closes whatever stage is open.
+    Pipeline stages and report section builders each run inside stage().
+    """
 
-    max_writes = 20
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._current = None
+        self._origin = time.perf_counter()
+        self._wall0 = 0.0
+        self._cpu0 = 0.0
+        self._mem0 = 0
+        self._patched = {}
+
+    # ---- Stage boundaries ----
+
+    def begin(self, name, kind='stage'):
+        self.end()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._mem0 = tracemalloc.get_traced_memory()[0]
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._current = StageStats(name, kind, self._wall0 - self._origin)
+        return self._current
+
+    def end(self):
+        stage = self._current
+        if stage is None:
+            return None
+        stage.wall = time.perf_counter() - self._wall0
+        stage.cpu = time.process_time() - self._cpu0
+        if self.trace_memory:
+            stage.peak_bytes = max(0, tracemalloc.get_traced_memory()[1] - self._mem0)
+        self.stages.append(stage)
+        self._current = None
+        return stage
+
+    @contextlib.contextmanager
+    def stage(self, name, kind='stage'):
+        stage = self.begin(name, kind)
+        try:
+            yield stage
+        finally:
+            self.end()
+
+    def close(self):
+        self.end()
+        self.uninstrument()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    # ---- Hot function counters ----
+
+    def instrument(self, namespace, names=PROFILED_FUNCTIONS):
+        """Replace functions in namespace with wrappers that count calls per stage."""
+        for name in names:
+            func = namespace.get(name)
+            if func is None:
+                continue
+            self._patched[name] = func
+            namespace[name] = self._wrap(name, func)
+        self._namespace = namespace
+
+    def uninstrument(self):
+        for name, original in self._patched.items():
+            self._namespace[name] = original
+        self._patched = {}
+
+    def _wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stage = self._current
+                if stage is not None:
+                    entry = stage.calls.setdefault(name, [0, 0.0])
+                    entry[0] += 1
+                    entry[1] += time.perf_counter() - t0
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    # ---- Output ----
+
+    def write_summary(self, out=sys.stderr):
+        """Write the per-stage summary table."""
+        width = 130
+        call_cols = ''.join(f" {name:>17}" for name in PROFILED_FUNCTIONS)
+        out.write('\n' + '=' * width + '\n')
+        out.write("  PROFILE SUMMARY (calls / ms per stage)\n")
+        out.write('=' * width + '\n')
+        out.write(f"  {'Stage':<44} {'Wall ms':>9} {'CPU ms':>9} {'Records':>8} {'Peak KiB':>9}{call_cols}\n")
+        out.write(f"  {'-'*44} {'-'*9} {'-'*9} {'-'*8} {'-'*9}" + f" {'-'*17}" * len(PROFILED_FUNCTIONS) + '\n')
+        total_wall = total_cpu = 0.0
+        for st in self.stages:
+            total_wall += st.wall
+            total_cpu += st.cpu
+            name = st.name if st.kind == 'stage' else f"  {st.name}"
+            records = f"{st.records:,}" if st.records is not None else '-'
+            peak = f"{st.peak_bytes / 1024:,.1f}" if st.peak_bytes is not None else '-'
+            calls = ''
+            for fname in PROFILED_FUNCTIONS:
+                n, secs = st.calls.get(fname, (0, 0.0))
+                cell = f"{n}/{secs * 1000:.1f}" if n else '-'
+                calls += f" {cell:>17}"
+            out.write(f"  {name[:44]:<44} {st.wall * 1000:9.1f} {st.cpu * 1000:9.1f} {records:>8} {peak:>9}{calls}\n")
+        out.write(f"  {'TOTAL':<44} {total_wall * 1000:9.1f} {total_cpu * 1000:9.1f}\n")
+        if self.trace_memory:
+            out.write("  (peak memory is traced by tracemalloc, which slows timings; use --profile-no-memory for raw speed)\n")
+
+    def write_trace(self, path):
+        """Write stages as Chrome trace-event JSON (chrome://tracing, Perfetto)."""
+        events = []
+        for st in self.stages:
+            args = {'cpu_ms': round(st.cpu * 1000, 3)}
+            if st.records is not None:
+                args['records'] = st.records
+            if st.peak_bytes is not None:
+                args['peak_bytes'] = st.peak_bytes
+            for fname, (n, secs) in st.calls.items():
+                args[f'{fname}_calls'] = n
+                args[f'{fname}_ms'] = round(secs * 1000, 3)
+            events.append({
+                'name': st.name,
+                'cat': st.kind,
+                'ph': 'X',
+                'ts': round(st.start_offset * 1_000_000, 1),
+                'dur': round(st.wall * 1_000_000, 1),
+                'pid': os.getpid(),
+                'tid': 1 if st.kind == 'stage' else 2,
+                'args': args,
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, indent=1)
+
+
+class _NullProfiler:
+    """Stand-in used when --profile is off so main() has no branches."""
+
+    @contextlib.contextmanager
+    def stage(self, name, kind='stage'):
+        yield StageStats(name, kind, 0.0)
+
+
+# ============================================================
+# Analysis helpers
+# ============================================================
 
-    # Print WORKING writes first
-    print(f"\n  --- WORKING (Session {w_idx}) WRITES ---")
-    print(f"  {'#':>3} {'Offset':>10} {'Handle':>6} {'Sz':>3} {'Label':>22}   Hex Data")
-    print(f"  {'-'*3} {'-'*10} {'-'*6} {'-'*3} {'-'*22}   {'-'*70}")
-    for i, pkt in enumerate(w_writes[:max_writes]):
-        offset = (pkt['ts_us'] - w_t0) / 1_000_000.0
+def find_first_cmd_notification(notifs, t0, target_cmds):
+    """Find first notification matching any of the target command tuples."""
+    for pkt in notifs:
         label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-        hex_data = format_hex(pkt['data'], max_bytes=55)
-        print(f"  {i:3d} {offset:10.4f}s 0x{pkt['handle']:04X} {pkt['raw_size']:3d} {label:>22}   {hex_data}")
-
-    # Print FAILING writes
-    print(f"\n  --- FAILING (Session {f_idx}) WRITES ---")
-    print(f"  {'#':>3} {'Offset':>10} {'Handle':>6} {'Sz':>3} {'Label':>22}   Hex Data")
-    print(f"  {'-'*3} {'-'*10} {'-'*6} {'-'*3} {'-'*22}   {'-'*70}")
-    for i, pkt in enumerate(f_writes[:max_writes]):
-        offset = (pkt['ts_us'] - f_t0) / 1_000_000.0
+        if cmd in target_cmds:
+            offset = (pkt['ts_us'] - t0) / 1_000_000.0
+            return offset, pkt, label, cmd
+    return None, None, None, None
+
+
+def count_cmd_in_timewindow(notifs, t0, target_cmd, window_sec):
+    """Count notifications matching target_cmd within window_sec of t0."""
+    count = 0
+    for pkt in notifs:
+        offset = (pkt['ts_us'] - t0) / 1_000_000.0
+        if offset > window_sec:
+            break
         label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-        hex_data = format_hex(pkt['data'], max_bytes=55)
-        print(f"  {i:3d} {offset:10.4f}s 0x{pkt['handle']:04X} {pkt['raw_size']:3d} {label:>22}   {hex_data}")
-
-    # ============================================================
-    # 6. FIRST 30 NOTIFICATIONS side-by-side
-    # ============================================================
-    print_header("FIRST 30 NOTIFICATIONS - SIDE BY SIDE COMPARISON")
-
-    max_notifs = 30
-
-    # Print WORKING notifications
-    print(f"\n  --- WORKING (Session {w_idx}) NOTIFICATIONS ---")
-    print(f"  {'#':>3} {'Offset':>10} {'Handle':>6} {'Sz':>3} {'Label':>22}   Hex Data")
-    print(f"  {'-'*3} {'-'*10} {'-'*6} {'-'*3} {'-'*22}   {'-'*70}")
-    for i, pkt in enumerate(w_notifs[:max_notifs]):
-        offset = (pkt['ts_us'] - w_t0) / 1_000_000.0
+        if cmd == target_cmd:
+            count += 1
+    return count
+
+
+def analyze_notifications_in_window(notifs, t0, window_sec):
+    """Analyze all command types (notifications or writes) in the first window_sec seconds."""
+    cmd_counts = {}
+    cmd_first_seen = {}
+    total = 0
+    frag_data_count = 0
+    data_count = 0
+
+    for pkt in notifs:
+        offset = (pkt['ts_us'] - t0) / 1_000_000.0
+        if offset > window_sec:
+            break
+        total += 1
         label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-        hex_data = format_hex(pkt['data'], max_bytes=55)
-        print(f"  {i:3d} {offset:10.4f}s 0x{pkt['handle']:04X} {pkt['raw_size']:3d} {label:>22}   {hex_data}")
-
-    # Print FAILING notifications
-    print(f"\n  --- FAILING (Session {f_idx}) NOTIFICATIONS ---")
-    print(f"  {'#':>3} {'Offset':>10} {'Handle':>6} {'Sz':>3} {'Label':>22}   Hex Data")
-    print(f"  {'-'*3} {'-'*10} {'-'*6} {'-'*3} {'-'*22}   {'-'*70}")
-    for i, pkt in enumerate(f_notifs[:max_notifs]):
-        offset = (pkt['ts_us'] - f_t0) / 1_000_000.0
+        if is_cont:
+            frag_data_count += 1
+            continue
+        if cmd is not None:
+            key = f"{cmd[0]:02X}_{cmd[1]:02X}"
+            cmd_counts[key] = cmd_counts.get(key, 0) + 1
+            if key not in cmd_first_seen:
+                cmd_first_seen[key] = offset
+        else:
+            data_count += 1
+
+    return cmd_counts, cmd_first_seen, total, frag_data_count, data_count
+
+
+def cmd_key_label(key):
+    """Label for a 'CC_II' command key."""
+    parts = key.split('_')
+    cmd_tuple = (int(parts[0], 16), int(parts[1], 16))
+    return CMD_LABELS.get(cmd_tuple, f"CMD_{key}")
+
+
+def packet_columns(hex_header="Hex Data", hex_rule=70):
+    return [
+        Column('index', '#', 3, '3d'),
+        Column('offset', 'Offset', 10, '10.4f', suffix='s'),
+        Column('handle', 'Handle', 6, '04X', prefix='0x'),
+        Column('size', 'Sz', 3, '3d'),
+        Column('label', 'Label', 22, '>22'),
+        Column('hex', hex_header, sep='   ', rule=hex_rule),
+    ]
+
+
+def packet_rows(pkts, t0, max_bytes):
+    rows = []
+    for i, pkt in enumerate(pkts):
+        offset = (pkt['ts_us'] - t0) / 1_000_000.0
         label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-        hex_data = format_hex(pkt['data'], max_bytes=55)
-        print(f"  {i:3d} {offset:10.4f}s 0x{pkt['handle']:04X} {pkt['raw_size']:3d} {label:>22}   {hex_data}")
+        rows.append((i, offset, pkt['handle'], pkt['raw_size'], label,
+                     HexCell(pkt['data'], max_bytes)))
+    return rows
 
-    # ============================================================
-    # 7. KEY COMPARISON: First occurrences of key commands
-    # ============================================================
-    print_header("KEY COMPARISON: FIRST OCCURRENCE OF KEY NOTIFICATIONS")
 
-    def find_first_cmd_notification(notifs, t0, target_cmds):
-        """Find first notification matching any of the target command tuples."""
-        for pkt in notifs:
-            label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-            if cmd in target_cmds:
-                offset = (pkt['ts_us'] - t0) / 1_000_000.0
-                return offset, pkt, label, cmd
-        return None, None, None, None
-
-    def count_cmd_in_timewindow(notifs, t0, target_cmd, window_sec):
-        """Count notifications matching target_cmd within window_sec of t0."""
-        count = 0
-        for pkt in notifs:
-            offset = (pkt['ts_us'] - t0) / 1_000_000.0
-            if offset > window_sec:
-                break
-            label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-            if cmd == target_cmd:
-                count += 1
-        return count
-
-    # 02_11 collar slot notification
-    print("\n  First 02_11 (COLLAR_SLOT) notification:")
-    w_off, w_pkt, w_label, _ = find_first_cmd_notification(w_notifs, w_t0, [(0x02, 0x11)])
-    f_off, f_pkt, f_label, _ = find_first_cmd_notification(f_notifs, f_t0, [(0x02, 0x11)])
-    if w_off is not None:
-        print(f"    WORKING: +{w_off:.4f}s | handle=0x{w_pkt['handle']:04X} | {format_hex(w_pkt['data'], 40)}")
-    else:
-        print(f"    WORKING: NOT FOUND in session")
-    if f_off is not None:
-        print(f"    FAILING: +{f_off:.4f}s | handle=0x{f_pkt['handle']:04X} | {format_hex(f_pkt['data'], 40)}")
-    else:
-        print(f"    FAILING: NOT FOUND in session")
-
-    # 02_3C or 02_7A position notification
-    print("\n  First 02_3C or 02_7A (POSITION) notification:")
-    w_off, w_pkt, w_label, w_cmd = find_first_cmd_notification(w_notifs, w_t0, [(0x02, 0x3C), (0x02, 0x7A)])
-    f_off, f_pkt, f_label, f_cmd = find_first_cmd_notification(f_notifs, f_t0, [(0x02, 0x3C), (0x02, 0x7A)])
-    if w_off is not None:
-        print(f"    WORKING: +{w_off:.4f}s | {w_label} | handle=0x{w_pkt['handle']:04X} | {format_hex(w_pkt['data'], 40)}")
-    else:
-        print(f"    WORKING: NOT FOUND in session")
-    if f_off is not None:
-        print(f"    FAILING: +{f_off:.4f}s | {f_label} | handle=0x{f_pkt['handle']:04X} | {format_hex(f_pkt['data'], 40)}")
-    else:
-        print(f"    FAILING: NOT FOUND in session")
-
-    # 02_29 device list response
-    print("\n  First 02_29 (RESP_29) notification:")
-    w_off, w_pkt, w_label, _ = find_first_cmd_notification(w_notifs, w_t0, [(0x02, 0x29)])
-    f_off, f_pkt, f_label, _ = find_first_cmd_notification(f_notifs, f_t0, [(0x02, 0x29)])
-    if w_off is not None:
-        print(f"    WORKING: +{w_off:.4f}s | handle=0x{w_pkt['handle']:04X} | {format_hex(w_pkt['data'], 40)}")
-    else:
-        print(f"    WORKING: NOT FOUND in session")
-    if f_off is not None:
-        print(f"    FAILING: +{f_off:.4f}s | handle=0x{f_pkt['handle']:04X} | {format_hex(f_pkt['data'], 40)}")
-    else:
-        print(f"    FAILING: NOT FOUND in session")
-
-    # 02_09 notifications in first 30 seconds
-    print("\n  02_09 (CONFIG) notifications in first 30 seconds:")
-    w_count = count_cmd_in_timewindow(w_notifs, w_t0, (0x02, 0x09), 30.0)
-    f_count = count_cmd_in_timewindow(f_notifs, f_t0, (0x02, 0x09), 30.0)
-    print(f"    WORKING: {w_count}")
-    print(f"    FAILING: {f_count}")
-
-    # 02_16 config notifications in first 30 seconds
-    print("\n  02_16 (CONFIG_16) notifications in first 30 seconds:")
-    w_count = count_cmd_in_timewindow(w_notifs, w_t0, (0x02, 0x16), 30.0)
-    f_count = count_cmd_in_timewindow(f_notifs, f_t0, (0x02, 0x16), 30.0)
-    print(f"    WORKING: {w_count}")
-    print(f"    FAILING: {f_count}")
-
-    # ============================================================
-    # 8. ALL notification command types in first 60s - both sessions
-    # ============================================================
-    def analyze_notifications_in_window(notifs, t0, window_sec, session_name):
-        """Analyze all notification command types in the first window_sec seconds."""
-        cmd_counts = {}
-        cmd_first_seen = {}
-        total = 0
-        frag_data_count = 0
-        data_count = 0
-
-        for pkt in notifs:
-            offset = (pkt['ts_us'] - t0) / 1_000_000.0
-            if offset > window_sec:
-                break
-            total += 1
-            label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-            if is_cont:
-                frag_data_count += 1
+# ============================================================
+# Report sections
+# ============================================================
+#
+# Each capture is a dict: name, path, size, packets, sessions, and after
+# select_session(): idx, session, t0, writes, notifs.
+
+def load_capture(name, path, prof):
+    stats = {}
+    with prof.stage(f"parse_capture: {name}") as st:
+        packets = parse_capture(path, stats)
+        st.records = stats.get('records', 0)
+    return {'name': name, 'path': path, 'size': os.path.getsize(path), 'packets': packets}
+
+
+def select_session(cap, idx):
+    s, e = cap['sessions'][idx]
+    session = cap['packets'][s:e+1]
+    cap['idx'] = idx
+    cap['session'] = session
+    cap['t0'] = session[0]['ts_us']
+    cap['writes'] = [p for p in session if p['type'] == 'write']
+    cap['notifs'] = [p for p in session if p['type'] == 'notification']
+
+
+def section_overview(w, f):
+    sec = Section("BTSNOOP COMPARISON: WORKING (Garmin Explore) vs FAILING (GdogTAK)")
+    for cap in (w, f):
+        sec.add(Fact('files', "  {capture} file: {path}", capture=cap['name'], path=cap['path']))
+    for cap in (w, f):
+        sec.add(Fact('file_sizes', "  {capture} file size: {size:,} bytes",
+                     capture=cap['name'], size=cap['size']))
+    for cap in (w, f):
+        sec.add(Fact('att_packets', "  {capture}: found {packets} ATT packets (writes + notifications)",
+                     capture=cap['name'], packets=len(cap['packets'])))
+    return sec
+
+
+def section_sessions(w, f):
+    sec = Section("SESSION DETECTION")
+    for cap in (w, f):
+        pkts = cap['packets']
+        sec.add(Text(f"\n  {cap['name']} file: {len(cap['sessions'])} sessions detected"))
+        for i, (s, e) in enumerate(cap['sessions']):
+            duration = (pkts[e]['ts_us'] - pkts[s]['ts_us']) / 1_000_000.0
+            n_writes = sum(1 for p in pkts[s:e+1] if p['type'] == 'write')
+            n_notifs = sum(1 for p in pkts[s:e+1] if p['type'] == 'notification')
+            sec.add(Fact('sessions',
+                         "    Session {session}: {start:%H:%M:%S} - {end:%H:%M:%S} "
+                         "({duration:.1f}s) | {packets} pkts ({writes} writes, {notifications} notifs)",
+                         capture=cap['name'], session=i, start=pkts[s]['timestamp'],
+                         end=pkts[e]['timestamp'], duration=duration, packets=e-s+1,
+                         writes=n_writes, notifications=n_notifs))
+    return sec
+
+
+def section_selected(w, f, warnings):
+    sec = Section("SELECTED SESSIONS FOR COMPARISON")
+    for warning in warnings:
+        sec.add(Fact('selection_warning',
+                     "\n  WARNING: Expected {expected} sessions in {capture} file, found {found}\n"
+                     "  Using last session as fallback", **warning))
+    for cap in (w, f):
+        sec.add(Fact('selected_sessions',
+                     "  {capture}: Session {session} | Start: {start:%H:%M:%S.%f} | {packets} packets",
+                     capture=cap['name'], session=cap['idx'], start=cap['session'][0]['timestamp'],
+                     packets=len(cap['session'])))
+    for cap in (w, f):
+        sec.add(Fact('selected_counts', "  {capture}: {writes} writes, {notifications} notifications",
+                     capture=cap['name'], writes=len(cap['writes']), notifications=len(cap['notifs'])))
+    return sec
+
+
+def section_first_packets(w, f, kind, limit):
+    key = 'writes' if kind == 'write' else 'notifs'
+    noun = 'WRITES' if kind == 'write' else 'NOTIFICATIONS'
+    sec = Section(f"FIRST {limit} {noun} - SIDE BY SIDE COMPARISON")
+    for cap in (w, f):
+        sec.add(Text(f"\n  --- {cap['name']} (Session {cap['idx']}) {noun} ---"))
+        sec.add(Table(f"first_{key}", packet_columns(),
+                      packet_rows(cap[key][:limit], cap['t0'], 55), capture=cap['name']))
+    return sec
+
+
+def section_key_comparison(w, f):
+    sec = Section("KEY COMPARISON: FIRST OCCURRENCE OF KEY NOTIFICATIONS")
+    checks = [
+        ("02_11", "First 02_11 (COLLAR_SLOT) notification:", [(0x02, 0x11)], False),
+        ("02_3C/02_7A", "First 02_3C or 02_7A (POSITION) notification:", [(0x02, 0x3C), (0x02, 0x7A)], True),
+        ("02_29", "First 02_29 (RESP_29) notification:", [(0x02, 0x29)], False),
+    ]
+    for check, heading, cmds, show_label in checks:
+        sec.add(Text(f"\n  {heading}"))
+        for cap in (w, f):
+            off, pkt, label, _ = find_first_cmd_notification(cap['notifs'], cap['t0'], cmds)
+            if off is None:
+                sec.add(Fact('first_occurrence', "    {capture}: NOT FOUND in session",
+                             check=check, capture=cap['name'], found=False))
                 continue
-            if cmd is not None:
-                key = f"{cmd[0]:02X}_{cmd[1]:02X}"
-                cmd_counts[key] = cmd_counts.get(key, 0) + 1
-                if key not in cmd_first_seen:
-                    cmd_first_seen[key] = offset
-            else:
-                data_count += 1
-
-        return cmd_counts, cmd_first_seen, total, frag_data_count, data_count
-
-    print_header(f"WORKING SESSION: ALL NOTIFICATION COMMAND TYPES IN FIRST 60 SECONDS")
-    w_cmd_counts, w_cmd_first, w_total, w_frag_data, w_data = analyze_notifications_in_window(w_notifs, w_t0, 60.0, "WORKING")
-    print(f"\n  Total notifications in first 60s: {w_total}")
-    print(f"  Fragment continuation data: {w_frag_data}")
-    print(f"  Non-command data: {w_data}")
-    print(f"\n  {'Command':>12} {'Count':>6} {'First Seen':>12}   Label")
-    print(f"  {'-'*12} {'-'*6} {'-'*12}   {'-'*25}")
-    for key in sorted(w_cmd_counts.keys()):
-        parts = key.split('_')
-        cmd_tuple = (int(parts[0], 16), int(parts[1], 16))
-        label = CMD_LABELS.get(cmd_tuple, f"CMD_{key}")
-        print(f"  {key:>12} {w_cmd_counts[key]:6d} {w_cmd_first[key]:11.4f}s   {label}")
-
-    print_header(f"FAILING SESSION: ALL NOTIFICATION COMMAND TYPES IN FIRST 60 SECONDS")
-    f_cmd_counts, f_cmd_first, f_total, f_frag_data, f_data = analyze_notifications_in_window(f_notifs, f_t0, 60.0, "FAILING")
-    print(f"\n  Total notifications in first 60s: {f_total}")
-    print(f"  Fragment continuation data: {f_frag_data}")
-    print(f"  Non-command data: {f_data}")
-    print(f"\n  {'Command':>12} {'Count':>6} {'First Seen':>12}   Label")
-    print(f"  {'-'*12} {'-'*6} {'-'*12}   {'-'*25}")
-    for key in sorted(f_cmd_counts.keys()):
-        parts = key.split('_')
-        cmd_tuple = (int(parts[0], 16), int(parts[1], 16))
-        label = CMD_LABELS.get(cmd_tuple, f"CMD_{key}")
-        print(f"  {key:>12} {f_cmd_counts[key]:6d} {f_cmd_first[key]:11.4f}s   {label}")
-
-    # ============================================================
-    # DIFF SUMMARY
-    # ============================================================
-    print_header("DIFF SUMMARY: Notification Commands (first 60s)")
+            template = ("    {capture}: +{offset:.4f}s | {label} | handle=0x{handle:04X} | {hex}"
+                        if show_label else
+                        "    {capture}: +{offset:.4f}s | handle=0x{handle:04X} | {hex}")
+            sec.add(Fact('first_occurrence', template, check=check, capture=cap['name'],
+                         found=True, offset=off, label=label, handle=pkt['handle'],
+                         hex=HexCell(pkt['data'], 40)))
+
+    windows = [
+        ("02_09", "02_09 (CONFIG) notifications in first 30 seconds:", (0x02, 0x09)),
+        ("02_16", "02_16 (CONFIG_16) notifications in first 30 seconds:", (0x02, 0x16)),
+    ]
+    for check, heading, cmd in windows:
+        sec.add(Text(f"\n  {heading}"))
+        for cap in (w, f):
+            count = count_cmd_in_timewindow(cap['notifs'], cap['t0'], cmd, 30.0)
+            sec.add(Fact('window_counts', "    {capture}: {count}",
+                         check=check, capture=cap['name'], window=30.0, count=count))
+    return sec
+
+
+def command_summary_columns():
+    return [
+        Column('command', 'Command', 12, '>12'),
+        Column('count', 'Count', 6, '6d'),
+        Column('first_seen', 'First Seen', 12, '11.4f', suffix='s'),
+        Column('label', 'Label', sep='   ', rule=25),
+    ]
+
+
+def section_command_summary(cap, analysis):
+    cmd_counts, cmd_first, total, frag_data, data = analysis
+    sec = Section(f"{cap['name']} SESSION: ALL NOTIFICATION COMMAND TYPES IN FIRST 60 SECONDS")
+    sec.add(Fact('notification_totals',
+                 "\n  Total notifications in first 60s: {total}\n"
+                 "  Fragment continuation data: {frag_data}\n"
+                 "  Non-command data: {non_command}",
+                 capture=cap['name'], total=total, frag_data=frag_data, non_command=data))
+    sec.add(Text())
+    rows = [(key, cmd_counts[key], cmd_first[key], cmd_key_label(key))
+            for key in sorted(cmd_counts)]
+    sec.add(Table('notification_commands', command_summary_columns(), rows, capture=cap['name']))
+    return sec
+
+
+def section_diff_summary(w_analysis, f_analysis):
+    w_cmd_counts, w_cmd_first = w_analysis[:2]
+    f_cmd_counts, f_cmd_first = f_analysis[:2]
+    sec = Section("DIFF SUMMARY: Notification Commands (first 60s)")
 
     w_keys = set(w_cmd_counts.keys())
     f_keys = set(f_cmd_counts.keys())
-
-    only_working = w_keys - f_keys
-    only_failing = f_keys - w_keys
     both = w_keys & f_keys
 
-    if only_working:
-        print("\n  >>> Commands ONLY in WORKING session (not in FAILING):")
-        for key in sorted(only_working):
-            parts = key.split('_')
-            cmd_tuple = (int(parts[0], 16), int(parts[1], 16))
-            label = CMD_LABELS.get(cmd_tuple, f"CMD_{key}")
-            print(f"      {key} ({label}): {w_cmd_counts[key]} occurrences, first at +{w_cmd_first[key]:.4f}s")
-    else:
-        print("\n  No commands unique to WORKING session.")
-
-    if only_failing:
-        print("\n  >>> Commands ONLY in FAILING session (not in WORKING):")
-        for key in sorted(only_failing):
-            parts = key.split('_')
-            cmd_tuple = (int(parts[0], 16), int(parts[1], 16))
-            label = CMD_LABELS.get(cmd_tuple, f"CMD_{key}")
-            print(f"      {key} ({label}): {f_cmd_counts[key]} occurrences, first at +{f_cmd_first[key]:.4f}s")
-    else:
-        print("\n  No commands unique to FAILING session.")
+    for name, only, counts, first in (("WORKING", w_keys - f_keys, w_cmd_counts, w_cmd_first),
+                                      ("FAILING", f_keys - w_keys, f_cmd_counts, f_cmd_first)):
+        other = "FAILING" if name == "WORKING" else "WORKING"
+        if not only:
+            sec.add(Text(f"\n  No commands unique to {name} session."))
+            continue
+        sec.add(Text(f"\n  >>> Commands ONLY in {name} session (not in {other}):"))
+        for key in sorted(only):
+            sec.add(Fact('unique_commands',
+                         "      {command} ({label}): {count} occurrences, first at +{first_seen:.4f}s",
+                         capture=name, command=key, label=cmd_key_label(key),
+                         count=counts[key], first_seen=first[key]))
 
     if both:
-        print("\n  Commands in BOTH sessions (count comparison):")
-        print(f"    {'Command':>12} {'WORKING':>8} {'FAILING':>8} {'Diff':>8}   Label")
-        print(f"    {'-'*12} {'-'*8} {'-'*8} {'-'*8}   {'-'*25}")
+        sec.add(Text("\n  Commands in BOTH sessions (count comparison):"))
+        columns = [
+            Column('command', 'Command', 12, '>12'),
+            Column('working', 'WORKING', 8, '8d'),
+            Column('failing', 'FAILING', 8, '8d'),
+            Column('diff', 'Diff', 8, '+d', align='>'),
+            Column('label', 'Label', sep='   ', rule=25),
+        ]
+        rows = []
         for key in sorted(both):
-            parts = key.split('_')
-            cmd_tuple = (int(parts[0], 16), int(parts[1], 16))
-            label = CMD_LABELS.get(cmd_tuple, f"CMD_{key}")
             wc = w_cmd_counts.get(key, 0)
             fc = f_cmd_counts.get(key, 0)
-            diff = fc - wc
-            diff_str = f"{'+'if diff>=0 else ''}{diff}"
-            print(f"    {key:>12} {wc:8d} {fc:8d} {diff_str:>8}   {label}")
+            rows.append((key, wc, fc, fc - wc, cmd_key_label(key)))
+        sec.add(Table('common_commands', columns, rows, indent=4))
+    return sec
+
 
-    # ============================================================
-    # Write sequence comparison (command types only, skipping fragments)
-    # ============================================================
-    print_header("WRITE COMMAND SEQUENCE COMPARISON: First 20")
+def section_write_sequence(w, f, count=20):
+    sec = Section(f"WRITE COMMAND SEQUENCE COMPARISON: First {count}")
 
-    def get_write_labels(writes, t0, count=20):
+    def get_write_labels(writes, t0):
         seq = []
         for pkt in writes[:count]:
             label, is_cont, cmd, frag_info = extract_command(pkt['data'])
@@ -594,129 +1083,241 @@ def main():
             seq.append((offset, label, pkt['raw_size']))
         return seq
 
-    w_write_seq = get_write_labels(w_writes, w_t0, 20)
-    f_write_seq = get_write_labels(f_writes, f_t0, 20)
-
-    max_len = max(len(w_write_seq), len(f_write_seq))
-    print(f"\n  {'#':>3} {'W-Offset':>10} {'W-Sz':>4} {'WORKING Label':>24} | {'F-Offset':>10} {'F-Sz':>4} {'FAILING Label':>24} {'Match':>5}")
-    print(f"  {'-'*3} {'-'*10} {'-'*4} {'-'*24} | {'-'*10} {'-'*4} {'-'*24} {'-'*5}")
-    for i in range(max_len):
-        if i < len(w_write_seq):
-            w_part = f"{w_write_seq[i][0]:10.4f}s {w_write_seq[i][2]:4d} {w_write_seq[i][1]:>24}"
-        else:
-            w_part = f"{'':>10} {'':>4} {'':>24}"
-        if i < len(f_write_seq):
-            f_part = f"{f_write_seq[i][0]:10.4f}s {f_write_seq[i][2]:4d} {f_write_seq[i][1]:>24}"
-        else:
-            f_part = f"{'':>10} {'':>4} {'':>24}"
-
-        w_label = w_write_seq[i][1] if i < len(w_write_seq) else ""
-        f_label = f_write_seq[i][1] if i < len(f_write_seq) else ""
-        match = "  OK" if w_label == f_label else "DIFF"
-        print(f"  {i:3d} {w_part} | {f_part} {match}")
-
-    print("\n  (DIFF = labels differ between WORKING and FAILING)")
-
-    # ============================================================
-    # Extended: Show all WRITE command types in first 60s
-    # ============================================================
-    print_header("WRITE COMMAND TYPES IN FIRST 60 SECONDS")
-
-    w_wcmd, w_wcmd_first, w_wtotal, w_wfrag, w_wdata = analyze_notifications_in_window(w_writes, w_t0, 60.0, "WORKING")
-    f_wcmd, f_wcmd_first, f_wtotal, f_wfrag, f_wdata = analyze_notifications_in_window(f_writes, f_t0, 60.0, "FAILING")
-
-    print(f"\n  WORKING writes in first 60s: {w_wtotal} total, {w_wfrag} frag-data, {w_wdata} non-cmd")
-    print(f"  FAILING writes in first 60s: {f_wtotal} total, {f_wfrag} frag-data, {f_wdata} non-cmd")
-
-    all_wcmd_keys = sorted(set(w_wcmd.keys()) | set(f_wcmd.keys()))
-    print(f"\n  {'Command':>12} {'W-Count':>8} {'W-First':>10} {'F-Count':>8} {'F-First':>10}   Label")
-    print(f"  {'-'*12} {'-'*8} {'-'*10} {'-'*8} {'-'*10}   {'-'*25}")
-    for key in all_wcmd_keys:
-        parts = key.split('_')
-        cmd_tuple = (int(parts[0], 16), int(parts[1], 16))
-        label = CMD_LABELS.get(cmd_tuple, f"CMD_{key}")
-        wc = w_wcmd.get(key, 0)
-        fc = f_wcmd.get(key, 0)
-        wf = f"{w_wcmd_first[key]:.4f}s" if key in w_wcmd_first else "N/A"
-        ff = f"{f_wcmd_first[key]:.4f}s" if key in f_wcmd_first else "N/A"
-        print(f"  {key:>12} {wc:8d} {wf:>10} {fc:8d} {ff:>10}   {label}")
-
-    # ============================================================
-    # Extended: Detailed first 50 notifications for the FAILING session
-    # ============================================================
-    print_header("FAILING SESSION: FIRST 50 NOTIFICATIONS (DETAILED)")
-
-    print(f"\n  {'#':>3} {'Offset':>10} {'Handle':>6} {'Sz':>3} {'Label':>22}   Hex Data (full payload)")
-    print(f"  {'-'*3} {'-'*10} {'-'*6} {'-'*3} {'-'*22}   {'-'*80}")
-    for i, pkt in enumerate(f_notifs[:50]):
-        offset = (pkt['ts_us'] - f_t0) / 1_000_000.0
-        label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-        hex_data = format_hex(pkt['data'], max_bytes=70)
-        print(f"  {i:3d} {offset:10.4f}s 0x{pkt['handle']:04X} {pkt['raw_size']:3d} {label:>22}   {hex_data}")
-
-    # ============================================================
-    # Extended: Detailed first 50 notifications for the WORKING session
-    # ============================================================
-    print_header("WORKING SESSION: FIRST 50 NOTIFICATIONS (DETAILED)")
-
-    print(f"\n  {'#':>3} {'Offset':>10} {'Handle':>6} {'Sz':>3} {'Label':>22}   Hex Data (full payload)")
-    print(f"  {'-'*3} {'-'*10} {'-'*6} {'-'*3} {'-'*22}   {'-'*80}")
-    for i, pkt in enumerate(w_notifs[:50]):
-        offset = (pkt['ts_us'] - w_t0) / 1_000_000.0
-        label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-        hex_data = format_hex(pkt['data'], max_bytes=70)
-        print(f"  {i:3d} {offset:10.4f}s 0x{pkt['handle']:04X} {pkt['raw_size']:3d} {label:>22}   {hex_data}")
-
-    # ============================================================
-    # Extended: FULL notification timeline for first 60s - BOTH sessions
-    # ============================================================
-    print_header("NOTIFICATION TIMELINE: ALL COMMANDS IN FIRST 15 SECONDS")
-
-    def show_cmd_timeline(notifs, t0, window_sec, name):
-        print(f"\n  --- {name} ---")
-        print(f"  {'Offset':>10} {'Label':>24}   Hex (first 20 bytes)")
-        print(f"  {'-'*10} {'-'*24}   {'-'*60}")
-        count = 0
-        for pkt in notifs:
-            offset = (pkt['ts_us'] - t0) / 1_000_000.0
+    w_seq = get_write_labels(w['writes'], w['t0'])
+    f_seq = get_write_labels(f['writes'], f['t0'])
+
+    columns = [
+        Column('index', '#', 3, '3d'),
+        Column('w_offset', 'W-Offset', 10, '10.4f', suffix='s'),
+        Column('w_size', 'W-Sz', 4, '4d'),
+        Column('w_label', 'WORKING Label', 24, '>24'),
+        Column('f_offset', 'F-Offset', 10, '10.4f', suffix='s', sep=' | '),
+        Column('f_size', 'F-Sz', 4, '4d'),
+        Column('f_label', 'FAILING Label', 24, '>24'),
+        Column('match', 'Match', 5),
+    ]
+    rows = []
+    for i in range(max(len(w_seq), len(f_seq))):
+        w_off, w_label, w_size = w_seq[i] if i < len(w_seq) else (None, None, None)
+        f_off, f_label, f_size = f_seq[i] if i < len(f_seq) else (None, None, None)
+        match = "  OK" if (w_label or "") == (f_label or "") else "DIFF"
+        rows.append((i, w_off, w_size, w_label, f_off, f_size, f_label, match))
+    sec.add(Text())
+    sec.add(Table('write_sequence', columns, rows))
+    sec.add(Text("\n  (DIFF = labels differ between WORKING and FAILING)"))
+    return sec
+
+
+def section_write_commands(w, f):
+    sec = Section("WRITE COMMAND TYPES IN FIRST 60 SECONDS")
+    w_wcmd, w_wcmd_first, w_wtotal, w_wfrag, w_wdata = analyze_notifications_in_window(w['writes'], w['t0'], 60.0)
+    f_wcmd, f_wcmd_first, f_wtotal, f_wfrag, f_wdata = analyze_notifications_in_window(f['writes'], f['t0'], 60.0)
+
+    sec.add(Text())
+    for name, total, frag, data in (("WORKING", w_wtotal, w_wfrag, w_wdata),
+                                    ("FAILING", f_wtotal, f_wfrag, f_wdata)):
+        sec.add(Fact('write_totals',
+                     "  {capture} writes in first 60s: {total} total, {frag_data} frag-data, {non_command} non-cmd",
+                     capture=name, total=total, frag_data=frag, non_command=data))
+
+    columns = [
+        Column('command', 'Command', 12, '>12'),
+        Column('w_count', 'W-Count', 8, '8d'),
+        Column('w_first', 'W-First', 10, '.4f', suffix='s', align='>', missing='N/A'),
+        Column('f_count', 'F-Count', 8, '8d'),
+        Column('f_first', 'F-First', 10, '.4f', suffix='s', align='>', missing='N/A'),
+        Column('label', 'Label', sep='   ', rule=25),
+    ]
+    rows = [(key, w_wcmd.get(key, 0), w_wcmd_first.get(key), f_wcmd.get(key, 0),
+             f_wcmd_first.get(key), cmd_key_label(key))
+            for key in sorted(set(w_wcmd.keys()) | set(f_wcmd.keys()))]
+    sec.add(Text())
+    sec.add(Table('write_commands', columns, rows))
+    return sec
+
+
+def section_detailed_notifications(cap, limit=50):
+    sec = Section(f"{cap['name']} SESSION: FIRST {limit} NOTIFICATIONS (DETAILED)")
+    sec.add(Text())
+    sec.add(Table('detailed_notifications',
+                  packet_columns("Hex Data (full payload)", 80),
+                  packet_rows(cap['notifs'][:limit], cap['t0'], 70), capture=cap['name']))
+    return sec
+
+
+def section_timeline(w, f, kind, window_sec=15.0):
+    is_write = kind == 'write'
+    key = 'writes' if is_write else 'notifs'
+    sec = Section(f"{'WRITE' if is_write else 'NOTIFICATION'} TIMELINE: ALL COMMANDS IN FIRST 15 SECONDS")
+    columns = [
+        Column('offset', 'Offset', 10, '10.4f', suffix='s'),
+        Column('label', 'Label', 24, '>24'),
+    ]
+    if is_write:
+        columns.append(Column('size', 'Sz', 3, '3d'))
+    columns.append(Column('hex', 'Hex (first 20 bytes)', sep='   ', rule=60))
+
+    for cap in (w, f):
+        rows = []
+        for pkt in cap[key]:
+            offset = (pkt['ts_us'] - cap['t0']) / 1_000_000.0
             if offset > window_sec:
                 break
             label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-            if is_cont:
+            if is_cont and not is_write:
                 continue  # Skip continuation fragments for readability
-            hex_short = format_hex(pkt['data'], max_bytes=20)
-            print(f"  {offset:10.4f}s {label:>24}   {hex_short}")
-            count += 1
-        print(f"  ({count} command-start packets shown)")
-
-    show_cmd_timeline(w_notifs, w_t0, 15.0, "WORKING")
-    show_cmd_timeline(f_notifs, f_t0, 15.0, "FAILING")
-
-    # ============================================================
-    # Write timeline first 15s
-    # ============================================================
-    print_header("WRITE TIMELINE: ALL COMMANDS IN FIRST 15 SECONDS")
-
-    def show_write_timeline(writes, t0, window_sec, name):
-        print(f"\n  --- {name} ---")
-        print(f"  {'Offset':>10} {'Label':>24} {'Sz':>3}   Hex (first 20 bytes)")
-        print(f"  {'-'*10} {'-'*24} {'-'*3}   {'-'*60}")
-        count = 0
-        for pkt in writes:
-            offset = (pkt['ts_us'] - t0) / 1_000_000.0
-            if offset > window_sec:
-                break
-            label, is_cont, cmd, frag_info = extract_command(pkt['data'])
-            hex_short = format_hex(pkt['data'], max_bytes=20)
-            print(f"  {offset:10.4f}s {label:>24} {pkt['raw_size']:3d}   {hex_short}")
-            count += 1
-        print(f"  ({count} packets shown)")
+            hex_short = HexCell(pkt['data'], 20)
+            if is_write:
+                rows.append((offset, label, pkt['raw_size'], hex_short))
+            else:
+                rows.append((offset, label, hex_short))
+        sec.add(Text(f"\n  --- {cap['name']} ---"))
+        sec.add(Table(f"{kind}_timeline", columns, rows, capture=cap['name']))
+        shown = "packets" if is_write else "command-start packets"
+        sec.add(Fact(f"{kind}_timeline_counts", "  ({count} " + shown + " shown)",
+                     capture=cap['name'], count=len(rows)))
+    return sec
+
+
+# ============================================================
+# Main comparison
+# ============================================================
 
-    show_write_timeline(w_writes, w_t0, 15.0, "WORKING")
-    show_write_timeline(f_writes, f_t0, 15.0, "FAILING")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare a WORKING and a FAILING btsnoop_hci.log session.")
+    parser.add_argument('--working', default=WORKING_FILE,
+                        help="btsnoop log or pcapng of the working (Garmin Explore) session")
+    parser.add_argument('--failing', default=FAILING_FILE,
+                        help="btsnoop log or pcapng of the failing (GdogTAK) session")
+    parser.add_argument('--format', choices=sorted(RENDERERS), default='text',
+                        help="report output format (default: text)")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="write the report to FILE instead of stdout")
+    parser.add_argument('--profile', action='store_true',
+                        help="time each pipeline stage and report section, print summary to stderr")
+    parser.add_argument('--profile-pstats', metavar='FILE',
+                        help="also run under cProfile and dump pstats to FILE (implies --profile; "
+                             "per-stage helper call counts are skipped)")
+    parser.add_argument('--profile-trace', metavar='FILE',
+                        help="write Chrome trace-event JSON to FILE (implies --profile)")
+    parser.add_argument('--profile-no-memory', action='store_true',
+                        help="skip tracemalloc peak-memory tracking (lower overhead)")
+    args = parser.parse_args(argv)
+    if args.profile_pstats or args.profile_trace:
+        args.profile = True
+    return args
+
+
+def run(argv=None):
+    """Entry point: parse arguments and run main(), under the profiler if requested."""
+    args = parse_args(argv)
+    if not args.profile:
+        main(args.working, args.failing, fmt=args.format, output=args.output)
+        return
+
+    prof = StageProfiler(trace_memory=not args.profile_no_memory)
+    cprof = cProfile.Profile() if args.profile_pstats else None
+    if cprof is None:
+        # Under cProfile the counting wrappers would top the pstats listing
+        prof.instrument(globals())
+    try:
+        if cprof is not None:
+            cprof.enable()
+        main(args.working, args.failing, prof, fmt=args.format, output=args.output)
+    finally:
+        if cprof is not None:
+            cprof.disable()
+        prof.close()
+
+    prof.write_summary(sys.stderr)
+    if args.profile_trace:
+        prof.write_trace(args.profile_trace)
+        sys.stderr.write(f"  Trace events written to {args.profile_trace}\n")
+    if cprof is not None:
+        cprof.dump_stats(args.profile_pstats)
+        sys.stderr.write(f"  cProfile stats written to {args.profile_pstats}\n")
+        sys.stderr.write("  Top functions by internal time:\n")
+        pstats.Stats(cprof, stream=sys.stderr).sort_stats('tottime').print_stats(15)
+
+
+def build_report(working_file=WORKING_FILE, failing_file=FAILING_FILE, prof=None):
+    """Parse both captures and build the comparison Report."""
+    if prof is None:
+        prof = _NullProfiler()
+
+    w = load_capture("WORKING", working_file, prof)
+    f = load_capture("FAILING", failing_file, prof)
+
+    with prof.stage("detect_sessions") as st:
+        w['sessions'] = detect_sessions(w['packets'])
+        f['sessions'] = detect_sessions(f['packets'])
+        st.records = len(w['packets']) + len(f['packets'])
 
-    print_header("ANALYSIS COMPLETE")
+    # ---- Select target sessions ----
+    # WORKING: Session 3 (0-indexed) - the reconnect session at ~11:45
+    warnings = []
+    if len(w['sessions']) < 4:
+        w_idx = len(w['sessions']) - 1
+        warnings.append({'capture': w['name'], 'expected': 4, 'found': len(w['sessions']),
+                         'fallback_session': w_idx})
+    else:
+        w_idx = 3  # Session 3 (0-indexed)
+    select_session(w, w_idx)
+    # FAILING: Last session
+    select_session(f, len(f['sessions']) - 1)
+
+    report = Report("BTSNOOP COMPARISON: WORKING (Garmin Explore) vs FAILING (GdogTAK)")
+
+    def add(build, *args):
+        with prof.stage(build.__name__, 'section') as st:
+            section = build(*args)
+            st.name = section.title
+            st.records = section.record_count()
+        report.sections.append(section)
+        return section
+
+    add(section_overview, w, f)
+    add(section_sessions, w, f)
+    add(section_selected, w, f, warnings)
+    add(section_first_packets, w, f, 'write', 20)
+    add(section_first_packets, w, f, 'notification', 30)
+    add(section_key_comparison, w, f)
+
+    with prof.stage("analyze_notifications_in_window") as st:
+        w_analysis = analyze_notifications_in_window(w['notifs'], w['t0'], 60.0)
+        f_analysis = analyze_notifications_in_window(f['notifs'], f['t0'], 60.0)
+        st.records = w_analysis[2] + f_analysis[2]
+    add(section_command_summary, w, w_analysis)
+    add(section_command_summary, f, f_analysis)
+    add(section_diff_summary, w_analysis, f_analysis)
+
+    add(section_write_sequence, w, f)
+    add(section_write_commands, w, f)
+    add(section_detailed_notifications, f)
+    add(section_detailed_notifications, w)
+    add(section_timeline, w, f, 'notification')
+    add(section_timeline, w, f, 'write')
+    report.sections.append(Section("ANALYSIS COMPLETE"))
+    return report
+
+
+def main(working_file=WORKING_FILE, failing_file=FAILING_FILE, prof=None, fmt='text', output=None):
+    if prof is None:
+        prof = _NullProfiler()
+
+    report = build_report(working_file, failing_file, prof)
+
+    # Each section renders in its own stage, listed under this one.
+    with prof.stage(f"render: {fmt}"):
+        out = open_output(output, fmt)
+    try:
+        rows = RENDERERS[fmt](report, out, prof)
+    finally:
+        with prof.stage("flush output") as st:
+            out.close()
+    st.records = rows
 
 
 if __name__ == '__main__':
-    main()
+    run()
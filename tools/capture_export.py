@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Export a slice of a capture to pcapng for Wireshark.
+
+Wireshark struggles with our largest btsnoop logs, so this cuts out only the
+packets of interest: one session, one packet type, some commands, a time
+window. Fragmented Garmin messages are reassembled into a single ATT packet
+per message: a fragment following a full-MTU fragment with the same base byte
+and the next seq is appended to it. The MTU is learned from unambiguous
+continuations unless --mtu gives it. Every packet gets a pcapng comment
+with the decoded command label, fragment header and, when present, the
+decoded position, which shows up in Wireshark's packet list as pkt_comment.
+
+Input may be btsnoop or pcapng. Output uses LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR
+and is written in large batched blocks.
+
+Usage:
+    python capture_export.py btsnoop_hci.log -o slice.pcapng [--session N]
+        [--type notification] [--cmd 02_3C,07_16] [--start 0 --end 60]
+        [--mtu 244 | --no-reassemble]
+"""
+
+import argparse
+import struct
+
+from btsnoop_compare import (
+    LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR, PCAPNG_EPB, PCAPNG_IDB, PCAPNG_SHB,
+    btsnoop_unix_us, detect_sessions, extract_command, parse_capture,
+)
+import garmin_decode
+
+# ============================================================
+# Constants
+# ============================================================
+
+WRITE_BUFFER = 1 << 20      # flush batched blocks once this many bytes are queued
+
+ATT_OPCODES = {'write': 0x52, 'notification': 0x1B}
+
+OPT_ENDOFOPT = 0
+OPT_COMMENT = 1
+SHB_USERAPPL = 4
+
+
+# ============================================================
+# pcapng writer
+# ============================================================
+
+def _option(code, value):
+    pad = -len(value) % 4
+    return struct.pack('<HH', code, len(value)) + value + b'\x00' * pad
+
+
+def _block(block_type, body):
+    total = len(body) + 12
+    return struct.pack('<II', block_type, total) + body + struct.pack('<I', total)
+
+
+class PcapngWriter:
+    """
+    Little-endian pcapng writer for one HCI H4 (with direction header)
+    interface. Blocks are queued and written in WRITE_BUFFER-sized batches.
+    """
+
+    def __init__(self, path, application="capture_export.py", buffer_size=WRITE_BUFFER):
+        self.f = open(path, 'wb')
+        self.buffer_size = buffer_size
+        self.pending = []
+        self.pending_bytes = 0
+        self.count = 0
+
+        shb = (struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1) +
+               _option(SHB_USERAPPL, application.encode('utf-8')) + _option(OPT_ENDOFOPT, b''))
+        idb = struct.pack('<HHI', LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR, 0, 0)
+        self._queue(_block(PCAPNG_SHB, shb))
+        self._queue(_block(PCAPNG_IDB, idb))
+
+    def _queue(self, block):
+        self.pending.append(block)
+        self.pending_bytes += len(block)
+        if self.pending_bytes >= self.buffer_size:
+            self.flush()
+
+    def write_packet(self, ts_unix_us, frame, comment=None):
+        """Queue an Enhanced Packet Block for interface 0."""
+        ts = max(0, ts_unix_us)
+        body = struct.pack('<IIIII', 0, ts >> 32, ts & 0xFFFFFFFF, len(frame), len(frame))
+        body += frame + b'\x00' * (-len(frame) % 4)
+        if comment:
+            body += _option(OPT_COMMENT, comment.encode('utf-8')) + _option(OPT_ENDOFOPT, b'')
+        self._queue(_block(PCAPNG_EPB, body))
+        self.count += 1
+
+    def flush(self):
+        if self.pending:
+            self.f.write(b''.join(self.pending))
+            self.pending = []
+            self.pending_bytes = 0
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def hci_frame(pkt):
+    """Rebuild the PHDR + H4 ACL frame for an ATT packet dict."""
+    att = bytes([pkt['opcode']]) + struct.pack('<H', pkt['handle']) + pkt['data']
+    l2cap = struct.pack('<HH', len(att), 0x0004) + att
+    acl_handle = pkt.get('acl_handle', 0x0040) | 0x2000   # first automatically flushable
+    acl = bytes([0x02]) + struct.pack('<HH', acl_handle, len(l2cap)) + l2cap
+    return struct.pack('>I', 1 if pkt['is_received'] else 0) + acl
+
+
+# ============================================================
+# Selection / reassembly
+# ============================================================
+
+def _continues(last, data):
+    """True if data has last's base byte, the next seq and a high-bit header."""
+    return (len(data) > 2 and data[0] & 0x80 and data[0] == last[0] and
+            data[1] == (last[1] + 1) & 0xFF)
+
+
+def learn_fragment_sizes(packets):
+    """
+    Fragment size per (type, ATT handle), learned only from packets that are
+    followed by an unambiguous continuation (next base/seq and a payload that
+    doesn't start a command). Handles with no such evidence are left out.
+    """
+    sizes = {}
+    last = {}
+    for pkt in packets:
+        key = (pkt['type'], pkt['handle'])
+        data = pkt['data']
+        prev = last.get(key)
+        if prev is not None and _continues(prev, data) and extract_command(data)[1]:
+            sizes[key] = max(sizes.get(key, 0), len(prev))
+        last[key] = data
+    return sizes
+
+
+def reassemble(packets, mtu=None):
+    """
+    Merge Garmin fragments back into whole messages. Returns new packet dicts
+    (with a 'fragments' count) in time order.
+
+    The sender splits messages at the MTU, so a packet continues the open
+    message only when the message's last fragment was full size, the base
+    byte matches and seq is consecutive. The full size is mtu (notification
+    length including the 2-byte header) if given; otherwise it is learned per
+    handle by learn_fragment_sizes, and the packet's payload must also not
+    start a command. Continuation data that happens to start with 00 is only
+    merged with an explicit mtu, where a message that is an exact multiple of
+    the MTU is in turn merged with the next one.
+    """
+    full_size = learn_fragment_sizes(packets) if mtu is None else {}
+
+    messages = []
+    open_msgs = {}      # (type, ATT handle) -> [packet, payload parts, last fragment]
+    for pkt in packets:
+        data = pkt['data']
+        key = (pkt['type'], pkt['handle'])
+        current = open_msgs.get(key)
+        if current is not None:
+            last = current[2]
+            size = mtu if mtu is not None else full_size.get(key)
+            if (len(last) == size and _continues(last, data) and
+                    (mtu is not None or extract_command(data)[1])):
+                current[1].append(data[2:])
+                current[2] = data
+                continue
+            messages.append(current)
+        open_msgs[key] = [pkt, [data], data]
+    messages.extend(open_msgs.values())
+
+    out = []
+    for pkt, parts, _ in messages:
+        merged = dict(pkt)
+        merged['data'] = b''.join(parts)
+        merged['raw_size'] = len(merged['data'])
+        merged['fragments'] = len(parts)
+        out.append(merged)
+    out.sort(key=lambda p: p['ts_us'])
+    return out
+
+
+def cmd_key(cmd):
+    return f"{cmd[0]:02X}_{cmd[1]:02X}" if cmd else None
+
+
+def packet_comment(pkt):
+    """Decoded label, fragment header, reassembly and position for one packet."""
+    label, _, cmd, frag_info = extract_command(pkt['data'])
+    parts = [f"{label} {frag_info}".strip()]
+    if pkt.get('fragments', 1) > 1:
+        parts.append(f"reassembled from {pkt['fragments']} fragments ({pkt['raw_size']} bytes)")
+    if pkt['type'] == 'notification':
+        fix = garmin_decode.parse_notification(pkt['data'])
+        if fix is not None:
+            parts.append(f"{fix['device_type']} {fix['lat']:.6f},{fix['lon']:.6f}")
+    return ' | '.join(parts)
+
+
+def select_packets(packets, session=None, pkt_type=None, start=None, end=None):
+    """Filter by session, type and time window (seconds from the slice start)."""
+    if session is not None:
+        sessions = detect_sessions(packets)
+        if not 0 <= session < len(sessions):
+            raise ValueError(f"session {session} out of range ({len(sessions)} sessions)")
+        s, e = sessions[session]
+        packets = packets[s:e+1]
+    if pkt_type is not None:
+        packets = [p for p in packets if p['type'] == pkt_type]
+    if packets and (start is not None or end is not None):
+        t0 = packets[0]['ts_us']
+        lo = t0 + int((start or 0) * 1_000_000)
+        hi = t0 + int(end * 1_000_000) if end is not None else None
+        packets = [p for p in packets if p['ts_us'] >= lo and (hi is None or p['ts_us'] <= hi)]
+    return packets
+
+
+def filter_commands(packets, cmds):
+    """Keep packets whose command key (e.g. 02_3C) or label is in cmds."""
+    keep = []
+    for pkt in packets:
+        label, _, cmd, _ = extract_command(pkt['data'])
+        if cmd_key(cmd) in cmds or label.replace('FRAG>', '') in cmds:
+            keep.append(pkt)
+    return keep
+
+
+def export(capture, output, session=None, pkt_type=None, cmds=None, start=None, end=None,
+           do_reassemble=True, mtu=None):
+    """Write the selected packets of capture to output. Returns summary stats."""
+    packets = parse_capture(capture)
+    selected = select_packets(packets, session, pkt_type, start, end)
+    n_fragments = len(selected)
+    if do_reassemble:
+        selected = reassemble(selected, mtu)
+    n_messages = len(selected)
+    if cmds:
+        selected = filter_commands(selected, cmds)
+
+    with PcapngWriter(output) as writer:
+        for pkt in selected:
+            writer.write_packet(btsnoop_unix_us(pkt['ts_us']), hci_frame(pkt),
+                                packet_comment(pkt))
+    return {
+        'parsed': len(packets),
+        'fragments': n_fragments,
+        'messages': n_messages,
+        'written': writer.count,
+        'reassembled': sum(1 for p in selected if p.get('fragments', 1) > 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a filtered capture slice to pcapng for Wireshark.")
+    parser.add_argument('capture', help="btsnoop_hci.log or pcapng to read")
+    parser.add_argument('-o', '--output', required=True, metavar='FILE', help="pcapng file to write")
+    parser.add_argument('--session', type=int, help="export only this session (default: whole capture)")
+    parser.add_argument('--type', choices=sorted(ATT_OPCODES), help="only writes or only notifications")
+    parser.add_argument('--cmd', help="comma-separated command keys or labels, e.g. 02_3C,KEEPALIVE "
+                                      "(continuation fragments only survive with reassembly)")
+    parser.add_argument('--start', type=float, help="seconds from the slice start")
+    parser.add_argument('--end', type=float, help="seconds from the slice start")
+    parser.add_argument('--mtu', type=int,
+                        help="notification size (with the 2-byte fragment header) the sender splits at; "
+                             "default: learn it from continuation fragments")
+    parser.add_argument('--no-reassemble', action='store_true',
+                        help="keep fragments as separate packets")
+    args = parser.parse_args(argv)
+
+    cmds = {c.strip().upper() for c in args.cmd.split(',')} if args.cmd else None
+    try:
+        stats = export(args.capture, args.output, args.session, args.type, cmds,
+                       args.start, args.end, not args.no_reassemble, args.mtu)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"  Parsed {stats['parsed']} ATT packets from {args.capture}")
+    print(f"  Selected {stats['fragments']} packets"
+          + (f" ({stats['messages']} messages after reassembly)" if not args.no_reassemble else ""))
+    if cmds:
+        print(f"  Kept {stats['written']} of {stats['messages']} matching --cmd {args.cmd}")
+    if not args.no_reassemble:
+        print(f"  {stats['reassembled']} written packets were reassembled from fragments")
+    print(f"  Wrote {stats['written']} packets to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
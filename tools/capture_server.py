@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Resident btsnoop capture query server.
+
+Keeps parsed, indexed captures in memory (LRU-limited) and answers
+HTTP/JSON queries on localhost, so the track viewer and ad-hoc scripts can
+pull just the slice they need instead of re-running btsnoop_compare.py.
+
+Usage:
+    python capture_server.py [--port 8765] [--root DIR] [--max-captures 4] [CAPTURE ...]
+
+Endpoints (all GET, JSON responses):
+    /captures                    loaded captures, most recently used last
+    /sessions?capture=P          sessions detected by >30s gaps
+    /packets?capture=P&...       ATT packets (index, offset, type, handle, label, hex)
+    /commands?capture=P&...      command histogram with first-seen offsets
+    /track?capture=P&...         decoded positions as GeoJSON (or format=json)
+
+Common filters:
+    session=N        restrict to session N; start/end become session-relative
+    start=S, end=S   seconds from capture (or session) start, inclusive
+    cmd=02_3C,02_7A  command keys as printed by btsnoop_compare
+    type=write|notification
+    device=collar|handheld|contact   (/track only)
+    limit=N, offset=N                (/packets only, default limit 500)
+
+Capture paths are resolved against --root and must stay inside it. A capture
+is re-parsed when its size or mtime changes.
+"""
+
+import argparse
+import asyncio
+import bisect
+import collections
+import json
+import math
+import os
+import sys
+import time
+import urllib.parse
+
+from btsnoop_compare import CMD_LABELS, detect_sessions, extract_command, parse_capture
+import garmin_decode
+
+# ============================================================
+# Constants
+# ============================================================
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_CAPTURES = 4
+DEFAULT_PACKET_LIMIT = 500
+MAX_PACKET_LIMIT = 10_000
+
+TRACK_STYLES = {
+    garmin_decode.HANDHELD: ("Handheld Track", "#0000FF"),
+    garmin_decode.COLLAR: ("Dog Collar Track", "#FF0000"),
+    garmin_decode.CONTACT: ("Contact Track", "#00AA00"),
+}
+
+
+class QueryError(Exception):
+    """Bad request; carries the HTTP status to return."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ============================================================
+# Capture index
+# ============================================================
+
+class CaptureIndex:
+    """
+    A parsed capture with per-packet command labels, a timestamp array for
+    bisecting time ranges, a per-command index and decoded positions.
+    """
+
+    def __init__(self, path):
+        st = os.stat(path)
+        self.path = path
+        self.signature = (st.st_size, st.st_mtime_ns)
+        started = time.perf_counter()
+
+        self.packets = parse_capture(path)
+        self.ts = [p['ts_us'] for p in self.packets]
+        self.t0 = self.ts[0] if self.ts else 0
+        self.sessions = detect_sessions(self.packets)
+
+        self.labels = []
+        self.cmd_keys = []
+        self.by_cmd = collections.defaultdict(list)
+        self.fixes = []     # (packet index, fix dict)
+        for i, pkt in enumerate(self.packets):
+            label, is_cont, cmd, frag_info = extract_command(pkt['data'])
+            key = f"{cmd[0]:02X}_{cmd[1]:02X}" if cmd is not None else None
+            self.labels.append(label)
+            self.cmd_keys.append(key)
+            if key is not None:
+                self.by_cmd[key].append(i)
+            if pkt['type'] == 'notification':
+                fix = garmin_decode.parse_notification(pkt['data'])
+                if fix is not None:
+                    self.fixes.append((i, fix))
+        self.fix_index = [i for i, _ in self.fixes]
+
+        self.load_seconds = time.perf_counter() - started
+        self.last_used = time.time()
+
+    def summary(self):
+        return {
+            'capture': self.path,
+            'size': self.signature[0],
+            'packets': len(self.packets),
+            'sessions': len(self.sessions),
+            'fixes': len(self.fixes),
+            'load_ms': round(self.load_seconds * 1000, 1),
+        }
+
+    def index_range(self, query):
+        """Packet index range [lo, hi) for the session/start/end filters."""
+        lo, hi = 0, len(self.packets)
+        base = self.t0
+        if 'session' in query:
+            idx = _int_param(query, 'session')
+            if not 0 <= idx < len(self.sessions):
+                raise QueryError(404, f"session {idx} not found ({len(self.sessions)} sessions)")
+            s, e = self.sessions[idx]
+            lo, hi = s, e + 1
+            base = self.ts[s]
+        if 'start' in query:
+            t = base + int(_float_param(query, 'start') * 1_000_000)
+            lo = max(lo, bisect.bisect_left(self.ts, t, lo, hi))
+        if 'end' in query:
+            t = base + int(_float_param(query, 'end') * 1_000_000)
+            hi = min(hi, bisect.bisect_right(self.ts, t, lo, hi))
+        return lo, max(lo, hi), base
+
+    def select(self, query, lo, hi):
+        """Yield packet indices in [lo, hi) matching the cmd and type filters."""
+        pkt_type = query.get('type')
+        cmds = _cmd_param(query)
+        if cmds:
+            # Walk only the per-command lists, merged back into capture order
+            indices = sorted(i for key in cmds for i in self.by_cmd.get(key, ())
+                             if lo <= i < hi)
+        else:
+            indices = range(lo, hi)
+        for i in indices:
+            if pkt_type is None or self.packets[i]['type'] == pkt_type:
+                yield i
+
+
+# ============================================================
+# Queries
+# ============================================================
+
+def _int_param(query, name, default=None, minimum=None):
+    if name not in query:
+        return default
+    try:
+        value = int(query[name])
+    except ValueError:
+        raise QueryError(400, f"{name} must be an integer")
+    if minimum is not None and value < minimum:
+        raise QueryError(400, f"{name} must be >= {minimum}")
+    return value
+
+
+def _float_param(query, name):
+    try:
+        value = float(query[name])
+    except ValueError:
+        raise QueryError(400, f"{name} must be a number of seconds")
+    if not math.isfinite(value):
+        raise QueryError(400, f"{name} must be a finite number of seconds")
+    return value
+
+
+def _cmd_param(query):
+    if 'cmd' not in query:
+        return None
+    return {c.strip().upper() for c in query['cmd'].split(',') if c.strip()}
+
+
+def query_sessions(cap, query):
+    sessions = []
+    for i, (s, e) in enumerate(cap.sessions):
+        pkts = cap.packets[s:e+1]
+        sessions.append({
+            'session': i,
+            'start': pkts[0]['timestamp'].isoformat(),
+            'end': pkts[-1]['timestamp'].isoformat(),
+            'start_offset': (cap.ts[s] - cap.t0) / 1_000_000.0,
+            'duration': (cap.ts[e] - cap.ts[s]) / 1_000_000.0,
+            'packets': e - s + 1,
+            'writes': sum(1 for p in pkts if p['type'] == 'write'),
+            'notifications': sum(1 for p in pkts if p['type'] == 'notification'),
+        })
+    return {'capture': cap.path, 'sessions': sessions}
+
+
+def query_packets(cap, query):
+    limit = min(_int_param(query, 'limit', DEFAULT_PACKET_LIMIT, minimum=0), MAX_PACKET_LIMIT)
+    skip = _int_param(query, 'offset', 0, minimum=0)
+    lo, hi, base = cap.index_range(query)
+    rows = []
+    total = 0
+    for i in cap.select(query, lo, hi):
+        total += 1
+        if total <= skip or len(rows) >= limit:
+            continue
+        pkt = cap.packets[i]
+        rows.append({
+            'index': i,
+            'offset': (pkt['ts_us'] - base) / 1_000_000.0,
+            'timestamp': pkt['timestamp'].isoformat(),
+            'type': pkt['type'],
+            'handle': pkt['handle'],
+            'size': pkt['raw_size'],
+            'label': cap.labels[i],
+            'cmd': cap.cmd_keys[i],
+            'hex': pkt['data'].hex(),
+        })
+    return {'capture': cap.path, 'total': total, 'offset': skip, 'packets': rows}
+
+
+def query_commands(cap, query):
+    lo, hi, base = cap.index_range(query)
+    counts = {}
+    for i in cap.select(query, lo, hi):
+        key = cap.cmd_keys[i]
+        if key is None:
+            continue
+        entry = counts.get(key)
+        if entry is None:
+            cmd_tuple = (int(key[:2], 16), int(key[3:], 16))
+            counts[key] = entry = {
+                'label': CMD_LABELS.get(cmd_tuple, f"CMD_{key}"),
+                'count': 0,
+                'first_seen': (cap.ts[i] - base) / 1_000_000.0,
+            }
+        entry['count'] += 1
+    return {'capture': cap.path, 'commands': dict(sorted(counts.items()))}
+
+
+def query_track(cap, query):
+    """
+    Positions per device type. Fixes carrying a 'device_id' are split into
+    one track per device; points carry the ID so format=json clients can
+    do the same. Without an ID every device of a type shares one track.
+    """
+    lo, hi, base = cap.index_range(query)
+    device = query.get('device')
+    cmds = _cmd_param(query)
+    start = bisect.bisect_left(cap.fix_index, lo)
+    stop = bisect.bisect_left(cap.fix_index, hi)
+
+    points = collections.defaultdict(list)
+    tracks = collections.defaultdict(list)     # (device_type, device_id) -> points
+    for i, fix in cap.fixes[start:stop]:
+        if device is not None and fix['device_type'] != device:
+            continue
+        if cmds and fix['cmd'] not in cmds:
+            continue
+        point = {
+            'offset': (cap.ts[i] - base) / 1_000_000.0,
+            'timestamp': cap.packets[i]['timestamp'].isoformat(),
+            'lat': fix['lat'],
+            'lon': fix['lon'],
+            'cmd': fix['cmd'],
+            'device_id': fix.get('device_id'),
+        }
+        points[fix['device_type']].append(point)
+        tracks[fix['device_type'], point['device_id']].append(point)
+
+    if query.get('format') == 'json':
+        return {'capture': cap.path, 'tracks': points}
+
+    features = []
+    for (device_type, device_id), pts in tracks.items():
+        name, color = TRACK_STYLES.get(device_type, (device_type, "#000000"))
+        features.append({
+            'type': 'Feature',
+            'properties': {
+                'name': f"{name} {device_id}" if device_id else name,
+                'device_type': device_type,
+                'device_id': device_id,
+                'stroke': color,
+                'stroke-width': 3,
+                'times': [p['timestamp'] for p in pts],
+            },
+            'geometry': {
+                'type': 'LineString',
+                'coordinates': [[p['lon'], p['lat']] for p in pts],
+            },
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+QUERIES = {
+    '/sessions': query_sessions,
+    '/packets': query_packets,
+    '/commands': query_commands,
+    '/track': query_track,
+}
+
+
+# ============================================================
+# Server
+# ============================================================
+
+class CaptureServer:
+    """asyncio HTTP/JSON front end over an LRU cache of CaptureIndex objects."""
+
+    def __init__(self, root, max_captures=DEFAULT_MAX_CAPTURES):
+        self.root = os.path.realpath(root)
+        self.max_captures = max_captures
+        self.cache = collections.OrderedDict()   # realpath -> CaptureIndex
+        self.loading = {}                        # realpath -> Future
+
+    def resolve(self, name):
+        path = os.path.realpath(os.path.join(self.root, name))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise QueryError(403, f"capture outside root: {name}")
+        if not os.path.isfile(path):
+            raise QueryError(404, f"capture not found: {name}")
+        return path
+
+    async def get_capture(self, name):
+        path = self.resolve(name)
+        st = os.stat(path)
+        cap = self.cache.get(path)
+        if cap is not None and cap.signature == (st.st_size, st.st_mtime_ns):
+            self.cache.move_to_end(path)
+            cap.last_used = time.time()
+            return cap
+
+        # Parse off the event loop; concurrent requests share one load
+        future = self.loading.get(path)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, CaptureIndex, path)
+            self.loading[path] = future
+            try:
+                cap = await future
+            finally:
+                del self.loading[path]
+            self.cache[path] = cap
+            self.cache.move_to_end(path)
+            while len(self.cache) > self.max_captures:
+                evicted, _ = self.cache.popitem(last=False)
+                print(f"  evicted {evicted}", file=sys.stderr)
+            print(f"  loaded {path}: {len(cap.packets)} packets in {cap.load_seconds:.2f}s",
+                  file=sys.stderr)
+            return cap
+        return await asyncio.shield(future)
+
+    async def dispatch(self, target):
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if url.path == '/captures':
+            return {'captures': [cap.summary() for cap in self.cache.values()],
+                    'max_captures': self.max_captures}
+        handler = QUERIES.get(url.path)
+        if handler is None:
+            raise QueryError(404, f"unknown endpoint: {url.path}")
+        if 'capture' not in query:
+            raise QueryError(400, "missing capture parameter")
+        cap = await self.get_capture(query['capture'])
+        return handler(cap, query)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                started = time.perf_counter()
+                try:
+                    if len(parts) != 3:
+                        raise QueryError(400, "malformed request line")
+                    if parts[0] not in ('GET', 'HEAD'):
+                        raise QueryError(405, f"method not allowed: {parts[0]}")
+                    status, body = 200, await self.dispatch(parts[1])
+                except QueryError as e:
+                    status, body = e.status, {'error': str(e)}
+                except Exception as e:  # keep serving other queries
+                    status, body = 500, {'error': f"{type(e).__name__}: {e}"}
+
+                payload = json.dumps(body, separators=(',', ':')).encode('utf-8')
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                head = (
+                    f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+                    "Content-Type: application/json\r\n"
+                    "Access-Control-Allow-Origin: *\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"X-Query-Time-Ms: {elapsed_ms:.2f}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode('latin-1'))
+                if parts and parts[0] != 'HEAD':
+                    writer.write(payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def preload(self, names):
+        for name in names:
+            try:
+                await self.get_capture(name)
+            except QueryError as e:
+                print(f"  WARNING: {e}", file=sys.stderr)
+
+    async def serve(self, host, port, preload=()):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"  Capture server on http://{host}:{port}/ (root {self.root})", file=sys.stderr)
+        await self.preload(preload)
+        async with server:
+            await server.serve_forever()
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+            405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve indexed btsnoop captures over HTTP/JSON.")
+    parser.add_argument('captures', nargs='*', help="captures to load at startup")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f"bind address (default {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--root', default='.',
+                        help="directory capture paths are resolved against (default: cwd)")
+    parser.add_argument('--max-captures', type=int, default=DEFAULT_MAX_CAPTURES,
+                        help="captures kept in memory before LRU eviction")
+    args = parser.parse_args(argv)
+
+    server = CaptureServer(args.root, args.max_captures)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.captures))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
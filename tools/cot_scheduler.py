@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Per-UID CoT emission scheduler for the bridge/replay path.
+
+AtakBroadcaster.sendCot sends one UDP datagram per decoded fix, and the same
+position can be decoded several times (02_3C and 02_7A, or once per
+fragment). With several collars, handhelds and contacts that floods the SA
+multicast group. The scheduler sits between the decoder and the socket:
+
+- keeps only the latest fix per device (newer fixes coalesce unsent ones)
+- suppresses fixes that moved less than --min-move meters since the last
+  sent one, but re-sends after half the stale window so the contact never
+  goes stale in ATAK
+- rate-limits each UID to one datagram per --min-interval seconds
+- emits everything that is due once per --tick, as one batch
+
+Position frames carry no device ID, so by default fixes are not keyed to a
+device: coalescing two collars would throw one dog's position away. They go
+out on the next tick, except exact repeats (same device type, lat and lon
+within half the stale window), which covers the 02_3C/02_7A and
+per-fragment duplicates. --dog-uid keys fixes per device type the way the
+app does, where every collar fix is sent under the single dogUid; that is
+only right with one collar in range. Callers that know each fix's device
+(garmin_synth --bench) pass the ID to replay() and get per-device state.
+
+Replaying a capture reports datagrams saved and the latency the scheduler
+added (send time minus fix arrival time):
+
+    python cot_scheduler.py btsnoop_hci.log [--session N] [--min-move 5] [--min-interval 1] [--dog-uid]
+    python cot_scheduler.py btsnoop_hci.log --send [--realtime]
+"""
+
+import argparse
+import datetime
+import math
+import socket
+import time
+
+from btsnoop_compare import detect_sessions, parse_capture
+import garmin_decode
+
+# ============================================================
+# Constants
+# ============================================================
+
+# ATAK SA multicast (same as AtakBroadcaster.kt)
+MULTICAST_ADDRESS = "239.2.3.1"
+MULTICAST_PORT = 6969
+
+# Same as CotGenerator.kt
+DEFAULT_COT_TYPE = "a-f-G-U-C"
+STALE_SECONDS = 30
+
+# AppPreferences.dogUid / dogCallsign defaults; the app sends every collar fix under them
+APP_DOG_UID = "GDOG-K9-001"
+APP_DOG_CALLSIGN = "K9-DOG1"
+
+DEFAULT_MIN_MOVE_M = 5.0
+DEFAULT_MIN_INTERVAL = 1.0
+DEFAULT_TICK = 0.5
+
+EARTH_RADIUS_M = 6371000.0
+
+
+# ============================================================
+# CoT
+# ============================================================
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Haversine distance in meters (GeoUtils.calculateDistance)."""
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (math.sin(d_lat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2)
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _escape_xml(text):
+    return (text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            .replace('"', "&quot;").replace("'", "&apos;"))
+
+
+def _cot_time(epoch_s):
+    dt = datetime.datetime.fromtimestamp(epoch_s, datetime.timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f"{dt.microsecond // 1000:03d}Z"
+
+
+def generate_cot(fix, uid, callsign, team="", epoch_s=None, cot_type=DEFAULT_COT_TYPE):
+    """CoT XML for one fix; mirrors CotGenerator.generateCot."""
+    if epoch_s is None:
+        epoch_s = time.time()
+    time_str = _cot_time(epoch_s)
+    stale_str = _cot_time(epoch_s + STALE_SECONDS)
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<event version="2.0" uid="{_escape_xml(uid)}" type="{cot_type}" time="{time_str}" '
+        f'start="{time_str}" stale="{stale_str}" how="m-g">',
+        f'    <point lat="{fix["lat"]:.7f}" lon="{fix["lon"]:.7f}" hae="0" ce="10.0" le="10.0"/>',
+        '    <detail>',
+        f'        <contact callsign="{_escape_xml(callsign)}"/>',
+        '        <remarks>SAR K9 - GPS Collar</remarks>',
+    ]
+    if team:
+        lines.append(f'        <__group name="{_escape_xml(team)}" role="K9 Unit"/>')
+    lines += [
+        '        <track course="0" speed="0"/>',
+        '        <precisionlocation altsrc="GPS" geopointsrc="GPS"/>',
+        '    </detail>',
+        '</event>',
+    ]
+    return '\n'.join(lines)
+
+
+# ============================================================
+# Scheduler
+# ============================================================
+
+class _UidState:
+    __slots__ = ('latest', 'arrival', 'pending', 'sent_fix', 'sent_at')
+
+    def __init__(self):
+        self.latest = None      # most recent fix
+        self.arrival = None     # when it arrived
+        self.pending = False    # moved enough to be worth sending
+        self.sent_fix = None
+        self.sent_at = None
+
+
+class CotScheduler:
+    """
+    Decides which fixes become datagrams. Time is passed in explicitly so the
+    same code runs against a live clock or a replayed capture.
+    """
+
+    def __init__(self, min_move_m=DEFAULT_MIN_MOVE_M, min_interval=DEFAULT_MIN_INTERVAL,
+                 stale_seconds=STALE_SECONDS):
+        self.min_move_m = min_move_m
+        self.min_interval = min_interval
+        self.refresh_interval = stale_seconds / 2.0
+        self.uids = {}
+        self.passthrough = []   # (uid, fix, arrival) for fixes with no device identity
+        self.recent = {}        # (device type, lat, lon) -> when an unkeyed fix last went out
+        self.stats = {'received': 0, 'sent': 0, 'coalesced': 0, 'suppressed': 0, 'refreshes': 0,
+                      'passthrough': 0, 'duplicates': 0}
+        self.latencies = []
+
+    def submit(self, uid, fix, now, keyed=True):
+        """
+        Record a decoded fix for uid at time now (seconds). With keyed=False
+        uid doesn't identify one device, so the fix is sent as is unless the
+        same position of the same device type went out in the last
+        refresh_interval.
+        """
+        self.stats['received'] += 1
+        if not keyed:
+            key = (fix['device_type'], fix['lat'], fix['lon'])
+            last = self.recent.get(key)
+            if last is not None and now - last < self.refresh_interval:
+                self.stats['duplicates'] += 1
+                return
+            self.recent[key] = now
+            self.stats['passthrough'] += 1
+            self.passthrough.append((uid, fix, now))
+            return
+        state = self.uids.get(uid)
+        if state is None:
+            state = self.uids[uid] = _UidState()
+        if state.pending:
+            self.stats['coalesced'] += 1
+        state.latest = fix
+        state.arrival = now
+
+        if state.sent_fix is None:
+            state.pending = True
+        elif distance_m(state.sent_fix['lat'], state.sent_fix['lon'],
+                        fix['lat'], fix['lon']) >= self.min_move_m:
+            state.pending = True
+        elif not state.pending:
+            self.stats['suppressed'] += 1
+
+    def tick(self, now):
+        """Return the batch of (uid, fix) due at time now."""
+        batch = []
+        for uid, fix, arrival in self.passthrough:
+            self.latencies.append(now - arrival)
+            batch.append((uid, fix))
+        self.passthrough = []
+        if self.recent:
+            self.recent = {k: t for k, t in self.recent.items() if now - t < self.refresh_interval}
+        for uid, state in self.uids.items():
+            if state.latest is None:
+                continue
+            since_sent = now - state.sent_at if state.sent_at is not None else math.inf
+            if state.pending:
+                if since_sent < self.min_interval:
+                    continue
+                self.latencies.append(now - state.arrival)
+            elif state.arrival > state.sent_at and since_sent >= self.refresh_interval:
+                # Small moves only: resend before the contact goes stale
+                self.stats['refreshes'] += 1
+            else:
+                continue
+            batch.append((uid, state.latest))
+            state.sent_fix = state.latest
+            state.sent_at = now
+            state.pending = False
+        self.stats['sent'] += len(batch)
+        return batch
+
+    def has_pending(self):
+        return bool(self.passthrough) or any(state.pending for state in self.uids.values())
+
+    def summary(self):
+        stats = dict(self.stats)
+        received = stats['received']
+        stats['saved'] = received - stats['sent']
+        stats['saved_pct'] = 100.0 * stats['saved'] / received if received else 0.0
+        lat = sorted(self.latencies)
+        if lat:
+            stats['latency_mean'] = sum(lat) / len(lat)
+            stats['latency_p95'] = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+            stats['latency_max'] = lat[-1]
+        return stats
+
+
+class CotSender:
+    """UDP multicast sender; sends each scheduler batch back to back."""
+
+    def __init__(self, group=MULTICAST_ADDRESS, port=MULTICAST_PORT, ttl=1):
+        self.address = (group, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.bytes_sent = 0
+
+    def send_batch(self, payloads):
+        for payload in payloads:
+            self.bytes_sent += self.sock.sendto(payload, self.address)
+
+    def close(self):
+        self.sock.close()
+
+
+# ============================================================
+# Replay
+# ============================================================
+
+def capture_fixes(path, session=None):
+    """
+    Return [(seconds from session start, fix, None)] for each decodable
+    notification; captures don't tell which device sent a fix.
+    """
+    packets = parse_capture(path)
+    sessions = detect_sessions(packets)
+    if not sessions:
+        return []
+    if session is None:
+        s, e = 0, len(packets) - 1
+    elif not 0 <= session < len(sessions):
+        raise ValueError(f"session {session} out of range ({len(sessions)} sessions)")
+    else:
+        s, e = sessions[session]
+    t0 = packets[s]['ts_us']
+    fixes = []
+    for pkt in packets[s:e+1]:
+        if pkt['type'] != 'notification':
+            continue
+        fix = garmin_decode.parse_notification(pkt['data'])
+        if fix is not None:
+            fixes.append(((pkt['ts_us'] - t0) / 1_000_000.0, fix, None))
+    return fixes
+
+
+def fix_uid(fix, prefix, device_id=None, dog_uid=None):
+    """
+    (uid, keyed) for a fix. Keyed per device when device_id is known, per
+    device type with dog_uid (collars share dog_uid, like the app), else a
+    per-type UID that is not keyed.
+    """
+    device_type = fix['device_type'].upper()
+    if device_id is not None:
+        return f"{prefix}-{device_type}-{device_id.replace('-', '')}", True
+    if dog_uid is not None:
+        if fix['device_type'] == garmin_decode.COLLAR:
+            return dog_uid, True
+        return f"{prefix}-{device_type}", True
+    return f"{prefix}-{device_type}", False
+
+
+def replay(fixes, scheduler, tick, emit=None, realtime=False, uid_prefix="GDOG", dog_uid=None):
+    """
+    Feed (t, fix, device_id) through the scheduler on a virtual clock ticking
+    every tick seconds. device_id may be None. emit(batch) is called for
+    every non-empty batch.
+    """
+    next_tick = 0.0
+    started = time.monotonic()
+    last_t = 0.0
+
+    def run_ticks_until(t):
+        nonlocal next_tick
+        while next_tick <= t:
+            if realtime:
+                delay = started + next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            batch = scheduler.tick(next_tick)
+            if batch and emit is not None:
+                emit(batch, next_tick)
+            next_tick += tick
+
+    for t, fix, device_id in fixes:
+        run_ticks_until(t)
+        uid, keyed = fix_uid(fix, uid_prefix, device_id, dog_uid)
+        scheduler.submit(uid, fix, t, keyed)
+        last_t = t
+    # Flush whatever is still waiting on the rate limit
+    while scheduler.has_pending():
+        run_ticks_until(max(next_tick, last_t))
+    return scheduler.summary()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a capture through the CoT emission scheduler.")
+    parser.add_argument('capture', help="btsnoop_hci.log to replay")
+    parser.add_argument('--session', type=int, help="replay only this session (default: whole capture)")
+    parser.add_argument('--min-move', type=float, default=DEFAULT_MIN_MOVE_M,
+                        help=f"meters a fix must move to be re-sent (default {DEFAULT_MIN_MOVE_M})")
+    parser.add_argument('--min-interval', type=float, default=DEFAULT_MIN_INTERVAL,
+                        help=f"minimum seconds between datagrams per UID (default {DEFAULT_MIN_INTERVAL})")
+    parser.add_argument('--tick', type=float, default=DEFAULT_TICK,
+                        help=f"scheduler tick in seconds (default {DEFAULT_TICK})")
+    parser.add_argument('--uid-prefix', default="GDOG")
+    parser.add_argument('--dog-uid', nargs='?', const=APP_DOG_UID, metavar='UID',
+                        help=f"key fixes per device type like the app: every collar fix under UID "
+                             f"(default {APP_DOG_UID}); only correct with one collar in range")
+    parser.add_argument('--callsign-prefix', default="K9")
+    parser.add_argument('--dog-callsign', default=APP_DOG_CALLSIGN, help="callsign used with --dog-uid")
+    parser.add_argument('--send', action='store_true',
+                        help=f"multicast the CoT to {MULTICAST_ADDRESS}:{MULTICAST_PORT}")
+    parser.add_argument('--realtime', action='store_true', help="pace the replay at capture speed")
+    args = parser.parse_args(argv)
+
+    try:
+        fixes = capture_fixes(args.capture, args.session)
+    except ValueError as e:
+        parser.error(str(e))
+    scheduler = CotScheduler(args.min_move, args.min_interval)
+    sender = CotSender() if args.send else None
+    cot_bytes = 0
+    sent_uids = set()
+
+    def emit(batch, t):
+        nonlocal cot_bytes
+        payloads = []
+        for uid, fix in batch:
+            sent_uids.add(uid)
+            if uid == args.dog_uid:
+                callsign = args.dog_callsign
+            else:
+                callsign = uid.replace(args.uid_prefix, args.callsign_prefix, 1)
+            payloads.append(generate_cot(fix, uid, callsign).encode('utf-8'))
+        cot_bytes += sum(len(p) for p in payloads)
+        if sender is not None:
+            sender.send_batch(payloads)
+
+    try:
+        stats = replay(fixes, scheduler, args.tick, emit, args.realtime, args.uid_prefix,
+                       args.dog_uid)
+    finally:
+        if sender is not None:
+            sender.close()
+
+    print(f"  Capture: {args.capture}" + (f" (session {args.session})" if args.session is not None else ""))
+    print(f"  UIDs: {', '.join(sorted(sent_uids)) or 'none'}")
+    print(f"  Fixes decoded (naive datagrams): {stats['received']}")
+    print(f"  Datagrams sent:                  {stats['sent']}  ({cot_bytes:,} bytes of CoT)")
+    print(f"  Datagrams saved:                 {stats['saved']}  ({stats['saved_pct']:.1f}%)")
+    print(f"    coalesced before send:         {stats['coalesced']}")
+    print(f"    {f'suppressed (< {args.min_move:g} m):':<31}{stats['suppressed']}")
+    print(f"    stale-window refreshes:        {stats['refreshes']}")
+    print(f"    repeated position (no device): {stats['duplicates']}")
+    print(f"  Passed through (no device key):  {stats['passthrough']}")
+    if 'latency_mean' in stats:
+        print(f"  Added latency: mean {stats['latency_mean'] * 1000:.0f} ms, "
+              f"p95 {stats['latency_p95'] * 1000:.0f} ms, max {stats['latency_max'] * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Python port of the Garmin Multi-Link position decoder.
+
+Mirrors android/app/src/main/java/com/gdogtak/ble/GarminProtocol.kt so
+captures can be decoded offline with the same rules the app uses:
+- 2-byte fragment header stripped when the first byte is >= 0x80
+- device markers 02 35 (collar), 02 28 (handheld), 02 33 (contact)
+- coordinate block 0A [len] 08 [lat varint] 10 [lon varint], optionally
+  nested as 0A [len] 0A [len] 08 ...
+- zigzag varints in Garmin semicircles
+
+Keep this file in step with GarminProtocol.kt when the decoder changes.
+"""
+
+# ============================================================
+# Constants
+# ============================================================
+
+DEVICE_COLLAR = 0x35
+DEVICE_HANDHELD = 0x28
+DEVICE_CONTACT = 0x33  # Other Alpha handhelds seen via VHF
+
+COLLAR = 'collar'
+HANDHELD = 'handheld'
+CONTACT = 'contact'
+
+SEMICIRCLE_DEGREES = 180.0 / 2147483648.0
+
+# Real GPS semicircles are large; smaller values are status codes
+MIN_SEMICIRCLES = 10_000_000
+
+
+# ============================================================
+# Varints / semicircles
+# ============================================================
+
+def decode_varint(data, offset):
+    """Decode a protobuf varint. Returns (value, bytes consumed)."""
+    result = 0
+    shift = 0
+    consumed = 0
+    while offset + consumed < len(data) and consumed < 10:
+        byte = data[offset + consumed]
+        result |= (byte & 0x7F) << shift
+        consumed += 1
+        if not byte & 0x80:
+            break
+        shift += 7
+    return result, consumed
+
+
+def zigzag_decode(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def semicircles_to_degrees(semicircles):
+    return semicircles * SEMICIRCLE_DEGREES
+
+
+# ============================================================
+# Notification decoding
+# ============================================================
+
+def strip_fragment_header(data):
+    """Drop the 2-byte [base+group][seq] header when the first byte is >= 0x80."""
+    if len(data) > 2 and data[0] >= 0x80:
+        return data[2:]
+    return data
+
+
+def find_device_marker(data, marker):
+    """Look for the 02 XX device marker in the first 30 bytes."""
+    for i in range(min(len(data) - 2, 30)):
+        if data[i] == 0x02 and data[i + 1] == marker:
+            return True
+    return False
+
+
+def try_decode_coordinates(data, offset):
+    """Decode lat/lon varints starting at offset. Returns (lat, lon) or None."""
+    if offset >= len(data) - 5:
+        return None
+
+    lat_varint, lat_len = decode_varint(data, offset)
+    lat_signed = zigzag_decode(lat_varint)
+
+    lon_offset = offset + lat_len
+    if lon_offset >= len(data) or data[lon_offset] != 0x10:
+        return None
+
+    lon_varint, _ = decode_varint(data, lon_offset + 1)
+    lon_signed = zigzag_decode(lon_varint)
+
+    if abs(lat_signed) < MIN_SEMICIRCLES and abs(lon_signed) < MIN_SEMICIRCLES:
+        return None
+
+    lat = semicircles_to_degrees(lat_signed)
+    lon = semicircles_to_degrees(lon_signed)
+    if -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0 and (lat != 0.0 or lon != 0.0):
+        return lat, lon
+    return None
+
+
+def find_coordinates(data):
+    """Find the first coordinate block and decode it. Returns (lat, lon) or None."""
+    for i in range(len(data) - 15):
+        if data[i] != 0x0A:
+            continue
+
+        # 0A [len] 08
+        if data[i + 2] == 0x08 and 8 <= data[i + 1] <= 50:
+            result = try_decode_coordinates(data, i + 3)
+            if result is not None:
+                return result
+
+        # Nested: 0A [outer] 0A [inner] 08
+        if (i + 4 < len(data) and data[i + 2] == 0x0A and data[i + 4] == 0x08 and
+                8 <= data[i + 1] <= 100 and 8 <= data[i + 3] <= 50):
+            result = try_decode_coordinates(data, i + 5)
+            if result is not None:
+                return result
+    return None
+
+
+def parse_notification(data):
+    """
+    Decode a position from one BLE notification.
+
+    Returns a dict with lat, lon, device_type ('collar', 'handheld' or
+    'contact') and cmd (e.g. '02_3C'), or None if no position is present.
+    """
+    if len(data) < 20:
+        return None
+
+    payload = strip_fragment_header(data)
+    if len(payload) < 18:
+        return None
+
+    coords = find_coordinates(payload)
+    if coords is None:
+        return None
+
+    cmd_hi = payload[1] if len(payload) > 1 else 0
+    cmd_lo = payload[2] if len(payload) > 2 else 0
+
+    if find_device_marker(payload, DEVICE_COLLAR):
+        device_type = COLLAR
+    elif find_device_marker(payload, DEVICE_CONTACT):
+        device_type = CONTACT
+    elif find_device_marker(payload, DEVICE_HANDHELD):
+        device_type = HANDHELD
+    elif cmd_hi == 0x02 and cmd_lo in (0x3C, 0x7A):
+        device_type = COLLAR    # 02_3C collar relay, 02_7A collar position
+    else:
+        device_type = HANDHELD  # 02_27 and unknown commands
+
+    return {
+        'lat': coords[0],
+        'lon': coords[1],
+        'device_type': device_type,
+        'cmd': f"{cmd_hi:02X}_{cmd_lo:02X}",
+    }
+
+
+# ============================================================
+# Device registry (07_16)
+# ============================================================
+
+def is_device_registry_packet(data):
+    """True for the ~229-byte 07_16 device registry notification."""
+    return len(data) > 50 and data[3] == 0x07 and data[4] == 0x16
+
+
+def parse_device_registry(data):
+    """
+    Extract collar entries from a 07_16 device registry notification.
+
+    Entries are 0A 10 [16-byte entry]; the first 4 bytes are the collar
+    device ID. Returns a list of 16-byte entries, de-duplicated by ID.
+    """
+    entries = []
+    if len(data) < 50 or data[3] != 0x07 or data[4] != 0x16:
+        return entries
+
+    seen = set()
+    for i in range(len(data) - 17):
+        if data[i] == 0x0A and data[i + 1] == 0x10:
+            entry = bytes(data[i + 2:i + 18])
+            device_id = entry[:4]
+            if any(b not in (0x00, 0x01) for b in device_id) and device_id not in seen:
+                seen.add(device_id)
+                entries.append(entry)
+    return entries
+
+
+def device_id_hex(entry):
+    """Format the 4-byte device ID of a registry entry as 33-91-77-CD."""
+    return '-'.join(f"{b:02X}" for b in entry[:4])
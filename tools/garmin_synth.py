@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Multi-collar Garmin notification stream synthesizer.
+
+Our captures only show one TT25 and one Alpha 300i, but a SAR callout can
+run 10-20 collars through one handheld. This generates the notification
+stream an Alpha would send for N collars, H handhelds and C contacts:
+
+- 02_3C collar positions (02 35 marker, nested 0A [len] 0A [len] 08 block),
+  optionally duplicated as 02_7A like the real device
+- 02_27 handheld (02 28) and contact (02 33) positions, flat 0A [len] 08 block
+- 07_16 device registry every --registry-interval seconds listing every
+  collar as 0A 10 [16-byte entry]
+- 2-byte [base|0x80][seq] fragment headers, splitting messages at --mtu
+
+The stream is either written as a btsnoop_hci.log (readable by
+btsnoop_compare.py, capture_server.py and Wireshark) or fed straight into
+the Python decoder and CoT scheduler to measure how they scale:
+
+    python garmin_synth.py --collars 20 --duration 600 -o synth_20.log
+    python garmin_synth.py --bench 1,5,10,20 --duration 600
+"""
+
+import argparse
+import math
+import random
+import struct
+import time
+
+from btsnoop_compare import BTSNOOP_UNIX_OFFSET_US
+import cot_scheduler
+import garmin_decode
+
+# ============================================================
+# Constants
+# ============================================================
+
+# Sample start point (alpha-test-track-geo.json)
+DEFAULT_LAT = 43.765880
+DEFAULT_LON = -115.977814
+
+DEFAULT_MTU = 244             # ATT notification payload for a 247-byte MTU
+DEFAULT_UPDATE_INTERVAL = 2.5  # TT25 fastest collar update rate
+DEFAULT_REGISTRY_INTERVAL = 20.0
+REGISTRY_MIN_SIZE = 227       # real 07_16 notifications are 229 bytes with the header
+CONTACT_INTERVAL_FACTOR = 4   # contacts (via VHF) update less often
+
+NOTIFY_HANDLE = 0x0011        # ATT handle used for synthesized notifications
+ACL_HANDLE = 0x0040           # HCI connection handle
+FRAGMENT_BASE = 0xA0          # session-specific fragment base (A0, B0, C0, ...)
+
+METERS_PER_DEG_LAT = 111_320.0
+
+
+# ============================================================
+# Encoding
+# ============================================================
+
+def encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def zigzag_encode(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def degrees_to_semicircles(degrees):
+    return int(round(degrees / garmin_decode.SEMICIRCLE_DEGREES))
+
+
+def coordinate_fields(lat, lon, timestamp):
+    """08 [lat] 10 [lon] 18 [timestamp] -- the body of a coordinate block."""
+    return (b'\x08' + encode_varint(zigzag_encode(degrees_to_semicircles(lat))) +
+            b'\x10' + encode_varint(zigzag_encode(degrees_to_semicircles(lon))) +
+            b'\x18' + encode_varint(timestamp))
+
+
+def position_message(cmd_id, marker, lat, lon, timestamp, nested):
+    """00 02 [cmd] 02 [marker] 01 00 [coordinate block]."""
+    body = coordinate_fields(lat, lon, timestamp)
+    block = b'\x0A' + bytes([len(body)]) + body
+    if nested:
+        block = b'\x0A' + bytes([len(block)]) + block
+    return bytes([0x00, 0x02, cmd_id, 0x02, marker, 0x01, 0x00]) + block
+
+
+def registry_message(collar_ids):
+    """
+    00 07 16 followed by one 0A 10 [16-byte entry] per collar, padded with a
+    12 [len] field to the size the real registry has with few collars.
+    """
+    parts = [b'\x00\x07\x16', b'\x08\x01']
+    for device_id in collar_ids:
+        entry = device_id + bytes([0x01, 0x00, 0x13, 0x02]) + b'\x00' * 8
+        parts.append(b'\x0A\x10' + entry)
+    message = b''.join(parts)
+    pad = REGISTRY_MIN_SIZE - len(message) - 2
+    if pad > 127:
+        pad -= 1    # two-byte length varint
+    if pad > 0:
+        message += b'\x12' + encode_varint(pad) + b'\x00' * pad
+    return message
+
+
+def fragment(message, seq, mtu=DEFAULT_MTU, base=FRAGMENT_BASE):
+    """
+    Split a message into notifications with 2-byte [base|0x80][seq] headers.
+    Returns (notifications, next seq).
+    """
+    chunk = mtu - 2
+    frames = []
+    for i in range(0, len(message), chunk):
+        frames.append(bytes([base | 0x80, seq & 0xFF]) + message[i:i + chunk])
+        seq += 1
+    return frames, seq
+
+
+# ============================================================
+# Simulation
+# ============================================================
+
+class Device:
+    """A moving collar, handheld or contact."""
+
+    def __init__(self, kind, device_id, lat, lon, speed, rng):
+        self.kind = kind
+        self.device_id = device_id
+        self.lat = lat
+        self.lon = lon
+        self.speed = speed      # m/s
+        self.heading = rng.uniform(0, 2 * math.pi)
+        self.rng = rng
+
+    def move(self, dt):
+        self.heading += self.rng.gauss(0, 0.6)
+        dist = self.speed * dt * self.rng.uniform(0.2, 1.5)
+        self.lat += dist * math.cos(self.heading) / METERS_PER_DEG_LAT
+        self.lon += dist * math.sin(self.heading) / (METERS_PER_DEG_LAT * math.cos(math.radians(self.lat)))
+
+
+def make_devices(collars, handhelds, contacts, seed=1, lat=DEFAULT_LAT, lon=DEFAULT_LON):
+    rng = random.Random(seed)
+    devices = []
+    for kind, count, speed in (('collar', collars, 2.5), ('handheld', handhelds, 1.2),
+                               ('contact', contacts, 1.2)):
+        for _ in range(count):
+            device_id = bytes(rng.randrange(0x02, 0x100) for _ in range(4))
+            devices.append(Device(kind, device_id,
+                                  lat + rng.uniform(-0.002, 0.002),
+                                  lon + rng.uniform(-0.002, 0.002), speed, rng))
+    return devices
+
+
+def generate_stream(devices, duration, interval=DEFAULT_UPDATE_INTERVAL,
+                    registry_interval=DEFAULT_REGISTRY_INTERVAL, mtu=DEFAULT_MTU,
+                    dup_7a=True, start_epoch=None):
+    """
+    Yield (seconds, notification bytes, device id) in time order. The device
+    id ('33-91-77-CD') is ground truth for the frame's sender, None for
+    registries; it is not in the frame, just as real position frames carry
+    no ID.
+
+    Each update round emits every collar (02_3C, plus 02_7A if dup_7a) and
+    handheld; contacts every CONTACT_INTERVAL_FACTOR rounds. Messages within
+    a round are spread 20 ms apart like the Alpha's relay bursts.
+    """
+    if start_epoch is None:
+        start_epoch = time.time()
+    collar_ids = [d.device_id for d in devices if d.kind == 'collar']
+    seq = 0
+    next_registry = 0.0
+    rounds = int(duration / interval) + 1
+    for r in range(rounds):
+        t = r * interval
+        messages = []   # (message, device id)
+        if collar_ids and t >= next_registry:
+            messages.append((registry_message(collar_ids), None))
+            next_registry += registry_interval
+        for dev in devices:
+            if r:
+                dev.move(interval)
+            if dev.kind == 'contact' and r % CONTACT_INTERVAL_FACTOR:
+                continue
+            ts = int(start_epoch + t)
+            device_id = garmin_decode.device_id_hex(dev.device_id)
+            if dev.kind == 'collar':
+                messages.append((position_message(0x3C, garmin_decode.DEVICE_COLLAR,
+                                                  dev.lat, dev.lon, ts, nested=True), device_id))
+                if dup_7a:
+                    messages.append((position_message(0x7A, garmin_decode.DEVICE_COLLAR,
+                                                      dev.lat, dev.lon, ts, nested=True), device_id))
+            else:
+                marker = (garmin_decode.DEVICE_HANDHELD if dev.kind == 'handheld'
+                          else garmin_decode.DEVICE_CONTACT)
+                messages.append((position_message(0x27, marker, dev.lat, dev.lon, ts, nested=False),
+                                 device_id))
+        offset = 0.0
+        for msg, device_id in messages:
+            frames, seq = fragment(msg, seq, mtu)
+            for frame in frames:
+                yield t + offset, frame, device_id
+                offset += 0.02
+
+
+# ============================================================
+# Output
+# ============================================================
+
+def att_notification_record(ts_us, value, handle=NOTIFY_HANDLE):
+    """btsnoop record for an ATT Handle Value Notification (received)."""
+    att = bytes([0x1B]) + struct.pack('<H', handle) + value
+    l2cap = struct.pack('<HH', len(att), 0x0004) + att
+    acl = bytes([0x02]) + struct.pack('<HH', ACL_HANDLE | 0x2000, len(l2cap)) + l2cap
+    return struct.pack('>IIIIq', len(acl), len(acl), 0x01, 0, ts_us) + acl
+
+
+def write_btsnoop(path, stream, start_epoch):
+    """Write the stream as btsnoop (HCI UART, datalink 1002) in one buffered pass."""
+    base_us = BTSNOOP_UNIX_OFFSET_US + int(start_epoch * 1_000_000)
+    count = 0
+    with open(path, 'wb', buffering=1 << 20) as f:
+        f.write(b'btsnoop\x00' + struct.pack('>II', 1, 1002))
+        for t, value, _ in stream:
+            f.write(att_notification_record(base_us + int(t * 1_000_000), value))
+            count += 1
+    return count
+
+
+def bench(counts, args):
+    """
+    Decode (and schedule) synthesized streams for each collar count.
+
+    Reg IDs is the fewest collar IDs parse_device_registry recovered from one
+    07_16 notification, out of the collars listed; a registry split across
+    fragments only yields the IDs in its first fragment.
+
+    Frames carry no device ID, so the decoder can't tell collars apart.
+    Default CoT is what cot_scheduler does with them (no device keys, exact
+    repeats dropped). Keyed CoT keys the scheduler on the synthesizer's
+    ground-truth sender, i.e. what per-device scheduling would send if the
+    ID were decoded; UIDs counts those states (collars + handhelds +
+    contacts).
+    """
+    print(f"  {'Collars':>7} {'Notifs':>8} {'Bytes':>10} {'Fixes':>7} {'Decode ms':>10} "
+          f"{'us/notif':>9} {'Reg IDs':>8} {'Naive CoT':>9} {'Default CoT':>11} "
+          f"{'UIDs':>5} {'Keyed CoT':>9} {'Sched ms':>9}")
+    print(f"  {'-'*7} {'-'*8} {'-'*10} {'-'*7} {'-'*10} {'-'*9} {'-'*8} {'-'*9} {'-'*11} "
+          f"{'-'*5} {'-'*9} {'-'*9}")
+    for n in counts:
+        devices = make_devices(n, args.handhelds, args.contacts, args.seed)
+        stream = list(generate_stream(devices, args.duration, args.interval,
+                                      args.registry_interval, args.mtu, not args.no_dup_7a))
+        n_bytes = sum(len(v) for _, v, _ in stream)
+
+        started = time.perf_counter()
+        fixes = []
+        registry_ids = []
+        for t, value, device_id in stream:
+            if garmin_decode.is_device_registry_packet(value):
+                registry_ids.append(len(garmin_decode.parse_device_registry(value)))
+                continue
+            fix = garmin_decode.parse_notification(value)
+            if fix is not None:
+                fixes.append((t, fix, device_id))
+        decode_s = time.perf_counter() - started
+
+        default = cot_scheduler.replay([(t, fix, None) for t, fix, _ in fixes],
+                                       cot_scheduler.CotScheduler(args.min_move, args.min_interval),
+                                       cot_scheduler.DEFAULT_TICK)
+
+        started = time.perf_counter()
+        scheduler = cot_scheduler.CotScheduler(args.min_move, args.min_interval)
+        keyed = cot_scheduler.replay(fixes, scheduler, cot_scheduler.DEFAULT_TICK)
+        sched_s = time.perf_counter() - started
+
+        reg = f"{min(registry_ids)}/{n}" if registry_ids else "-"
+        print(f"  {n:7d} {len(stream):8d} {n_bytes:10,d} {len(fixes):7d} {decode_s * 1000:10.1f} "
+              f"{decode_s * 1e6 / max(1, len(stream)):9.1f} {reg:>8} {keyed['received']:9d} "
+              f"{default['sent']:11d} {len(scheduler.uids):5d} {keyed['sent']:9d} {sched_s * 1000:9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthesize Garmin Alpha notification streams.")
+    parser.add_argument('--collars', type=int, default=10)
+    parser.add_argument('--handhelds', type=int, default=1)
+    parser.add_argument('--contacts', type=int, default=0)
+    parser.add_argument('--duration', type=float, default=300.0, help="seconds of traffic")
+    parser.add_argument('--interval', type=float, default=DEFAULT_UPDATE_INTERVAL,
+                        help="collar update interval in seconds")
+    parser.add_argument('--registry-interval', type=float, default=DEFAULT_REGISTRY_INTERVAL)
+    parser.add_argument('--mtu', type=int, default=DEFAULT_MTU,
+                        help="max notification size including the 2-byte fragment header")
+    parser.add_argument('--no-dup-7a', action='store_true', help="don't repeat collar fixes as 02_7A")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-o', '--output', metavar='FILE', help="write a btsnoop_hci.log")
+    parser.add_argument('--bench', metavar='N,N,...',
+                        help="decode streams for these collar counts and print scaling")
+    parser.add_argument('--min-move', type=float, default=cot_scheduler.DEFAULT_MIN_MOVE_M)
+    parser.add_argument('--min-interval', type=float, default=cot_scheduler.DEFAULT_MIN_INTERVAL)
+    args = parser.parse_args(argv)
+
+    if args.mtu < 8:
+        parser.error("--mtu must be at least 8")
+    if args.bench:
+        bench([int(n) for n in args.bench.split(',')], args)
+        return
+    if not args.output:
+        parser.error("give -o FILE or --bench")
+
+    start_epoch = time.time()
+    devices = make_devices(args.collars, args.handhelds, args.contacts, args.seed)
+    stream = generate_stream(devices, args.duration, args.interval, args.registry_interval,
+                             args.mtu, not args.no_dup_7a, start_epoch)
+    count = write_btsnoop(args.output, stream, start_epoch)
+    print(f"  Wrote {count} notifications ({args.collars} collars, {args.handhelds} handhelds, "
+          f"{args.contacts} contacts, {args.duration:.0f}s) to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
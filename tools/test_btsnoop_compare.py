@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Regression tests for btsnoop_compare parsing.
+
+    python -m unittest test_btsnoop_compare      (from tools/)
+"""
+
+import datetime
+import io
+import json
+import os
+import struct
+import tempfile
+import unittest
+
+import btsnoop_compare
+import capture_export
+from btsnoop_compare import parse_capture
+
+
+def notification_record(ts_us, value, handle=0x0011):
+    att = bytes([0x1B]) + struct.pack('<H', handle) + value
+    l2cap = struct.pack('<HH', len(att), 0x0004) + att
+    acl = bytes([0x02]) + struct.pack('<HH', 0x2040, len(l2cap)) + l2cap
+    return struct.pack('>IIIIq', len(acl), len(acl), 0x01, 0, ts_us) + acl
+
+
+def write_capture(path, timestamps):
+    with open(path, 'wb') as f:
+        f.write(b'btsnoop\x00' + struct.pack('>II', 1, 1002))
+        for i, ts_us in enumerate(timestamps):
+            f.write(notification_record(ts_us, bytes([0xA0, i & 0xFF, 0x00, 0x02, 0x3C]) + b'\x01' * 10))
+
+
+class RelativeTimestampTest(unittest.TestCase):
+    """Logs whose timestamps start near zero instead of on the 0000-01-01 scale."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.path = os.path.join(self.dir, 'relative.log')
+        write_capture(self.path, [5_000_000 + i * 500_000 for i in range(20)])
+
+    def test_parse(self):
+        packets = parse_capture(self.path)
+        self.assertEqual(len(packets), 20)
+        self.assertEqual(packets[0]['ts_us'], 5_000_000)
+        self.assertEqual(packets[0]['timestamp'],
+                         datetime.datetime(2000, 1, 1, 0, 0, 5, tzinfo=datetime.timezone.utc))
+
+    def test_json_report(self):
+        report = btsnoop_compare.build_report(self.path, self.path)
+        out = io.StringIO()
+        btsnoop_compare.render_json(report, out)
+        self.assertIn('2000-01-01T00:00:05', out.getvalue())
+        json.loads(out.getvalue())
+
+    def test_pcapng_round_trip_keeps_time(self):
+        output = os.path.join(self.dir, 'relative.pcapng')
+        capture_export.export(self.path, output, do_reassemble=False)
+        original = parse_capture(self.path)
+        exported = parse_capture(output)
+        self.assertEqual([p['timestamp'] for p in exported], [p['timestamp'] for p in original])
+
+    def test_absolute_timestamps(self):
+        unix_us = 1_760_000_000_000_000
+        path = os.path.join(self.dir, 'absolute.log')
+        write_capture(path, [btsnoop_compare.BTSNOOP_UNIX_OFFSET_US + unix_us])
+        self.assertEqual(parse_capture(path)[0]['timestamp'],
+                         datetime.datetime.fromtimestamp(unix_us / 1e6, datetime.timezone.utc))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Regression tests for capture_export.reassemble, on garmin_synth streams.
+
+    python -m unittest test_capture_export      (from tools/)
+"""
+
+import os
+import tempfile
+import unittest
+
+from btsnoop_compare import extract_command, parse_capture
+import capture_export
+import garmin_decode
+import garmin_synth
+
+
+def synth_capture(directory, name, collars, contacts=0, duration=120, mtu=garmin_synth.DEFAULT_MTU):
+    path = os.path.join(directory, name)
+    devices = garmin_synth.make_devices(collars, 1, contacts)
+    stream = garmin_synth.generate_stream(devices, duration, mtu=mtu, start_epoch=1_760_000_000)
+    garmin_synth.write_btsnoop(path, stream, 1_760_000_000)
+    return path
+
+
+def command_count(packets, key):
+    return sum(1 for p in packets if capture_export.cmd_key(extract_command(p['data'])[2]) == key)
+
+
+class ReassembleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_single_frame_registry_keeps_following_fix(self):
+        # The 229-byte 07_16 registry fits in one frame and is the largest
+        # notification; the 02_3C after it must not be merged into it.
+        packets = parse_capture(synth_capture(self.tmp.name, 'c3.log', collars=3, contacts=1))
+        merged = capture_export.reassemble(packets)
+        self.assertEqual(len(merged), len(packets))
+        self.assertEqual(command_count(merged, '02_3C'), command_count(packets, '02_3C'))
+        self.assertTrue(all(p['fragments'] == 1 for p in merged))
+
+    def test_fragmented_registry_with_explicit_mtu(self):
+        packets = parse_capture(synth_capture(self.tmp.name, 'c20.log', collars=20, mtu=120))
+        merged = capture_export.reassemble(packets, mtu=120)
+        registries = [p for p in merged if garmin_decode.is_device_registry_packet(p['data'])]
+        self.assertTrue(registries)
+        for pkt in registries:
+            self.assertEqual(len(garmin_decode.parse_device_registry(pkt['data'])), 20)
+        fixes = sum(1 for p in merged if garmin_decode.parse_notification(p['data']))
+        self.assertEqual(fixes, sum(1 for p in packets if garmin_decode.parse_notification(p['data'])))
+
+    def test_export_round_trip(self):
+        capture = synth_capture(self.tmp.name, 'c3.log', collars=3, contacts=1)
+        output = os.path.join(self.tmp.name, 'c3.pcapng')
+        stats = capture_export.export(capture, output, cmds={'02_3C'})
+        exported = parse_capture(output)
+        self.assertEqual(stats['written'], len(exported))
+        self.assertEqual(stats['messages'], len(capture_export.reassemble(parse_capture(capture))))
+        self.assertEqual(len(exported), command_count(parse_capture(capture), '02_3C'))
+        self.assertEqual([p['ts_us'] for p in exported],
+                         sorted(p['ts_us'] for p in exported))
+
+
+if __name__ == '__main__':
+    unittest.main()